@@ -70,6 +70,10 @@ class AppExecutionConfig(BaseSettings):
         description="Maximum number of concurrent active requests per app (0 for unlimited)",
         default=0,
     )
+    APP_MAX_WORKERS: PositiveInt = Field(
+        description="Maximum number of concurrent agent chat generations per process, further requests are rejected",
+        default=200,
+    )
     APP_DAILY_RATE_LIMIT: NonNegativeInt = Field(
         description="Maximum number of requests per app per day",
         default=5000,
@@ -818,6 +822,11 @@ class IndexingConfig(BaseSettings):
         default=4000,
     )
 
+    INDEXING_CLEAN_MAX_WORKERS: PositiveInt = Field(
+        description="Maximum number of concurrent vector index clean requests when re-indexing a large document",
+        default=4,
+    )
+
     CHILD_CHUNKS_PREVIEW_NUMBER: PositiveInt = Field(
         description="Maximum number of child chunks to preview",
         default=50,
@@ -496,7 +496,7 @@ class BaseAgentRunner(AppRunner):
         if not files:
             return UserPromptMessage(content=message.query)
         if message.app_model_config:
-            file_extra_config = FileUploadConfigManager.convert(message.app_model_config.to_dict())
+            file_extra_config = FileUploadConfigManager.convert_app_model_config(message.app_model_config)
         else:
             file_extra_config = None
 
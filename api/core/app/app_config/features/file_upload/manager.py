@@ -1,9 +1,22 @@
+import functools
+import json
 from collections.abc import Mapping
-from typing import Any
+from typing import TYPE_CHECKING, Any, Optional
 
 from constants import DEFAULT_FILE_NUMBER_LIMITS
 from core.file import FileUploadConfig
 
+if TYPE_CHECKING:
+    from models.model import AppModelConfig
+
+
+@functools.lru_cache(maxsize=1024)
+def _convert_file_upload(file_upload: str) -> Optional[FileUploadConfig]:
+    file_upload_config: Optional[FileUploadConfig] = FileUploadConfigManager.convert(
+        {"file_upload": json.loads(file_upload)}
+    )
+    return file_upload_config
+
 
 class FileUploadConfigManager:
     @classmethod
@@ -28,6 +41,19 @@ class FileUploadConfigManager:
 
                 return FileUploadConfig.model_validate(file_upload_dict)
 
+    @classmethod
+    def convert_app_model_config(cls, app_model_config: "AppModelConfig") -> Optional[FileUploadConfig]:
+        """
+        Convert the file upload feature of an app model config, cached by its raw file upload config
+
+        :param app_model_config: app model config
+        """
+        # without a file upload config the feature falls back to a disabled image config
+        if not app_model_config.file_upload:
+            return None
+        # the converted config is shared between requests and must be treated as read-only
+        return _convert_file_upload(app_model_config.file_upload)
+
     @classmethod
     def validate_and_set_defaults(cls, config: dict) -> tuple[dict, list[str]]:
         """
@@ -1,11 +1,11 @@
 import contextvars
 import logging
 import threading
-import uuid
 from collections.abc import Generator, Mapping
-from typing import Any, Literal, Union, overload
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Literal, Optional, Union, overload
 
-from flask import Flask, current_app
+from flask import Flask, current_app, g, has_request_context
 from pydantic import ValidationError
 
 from configs import dify_config
@@ -20,16 +20,28 @@ from core.app.apps.exc import GenerateTaskStoppedError
 from core.app.apps.message_based_app_generator import MessageBasedAppGenerator
 from core.app.apps.message_based_app_queue_manager import MessageBasedAppQueueManager
 from core.app.entities.app_invoke_entities import AgentChatAppGenerateEntity, InvokeFrom
+from core.errors.error import AppInvokeQuotaExceededError
 from core.model_runtime.errors.invoke import InvokeAuthorizationError
 from core.ops.ops_trace_manager import TraceQueueManager
 from extensions.ext_database import db
 from factories import file_factory
-from libs.flask_utils import preserve_flask_contexts
+from libs.uuid_utils import uuid4_str
 from models import Account, App, EndUser
 from services.conversation_service import ConversationService
 
 logger = logging.getLogger(__name__)
 
+# shared by all agent chat requests of the process to avoid spawning a thread per request
+_generate_worker_pool = ThreadPoolExecutor(max_workers=dify_config.APP_MAX_WORKERS, thread_name_prefix="agent-chat")
+# a request is rejected when all workers are busy instead of waiting in the pool queue until it times out
+_generate_worker_slots = threading.BoundedSemaphore(dify_config.APP_MAX_WORKERS)
+
+
+def _on_generate_worker_done(future: Future[None]) -> None:
+    _generate_worker_slots.release()
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Agent chat generate worker failed", exc_info=future.exception())
+
 
 class AgentChatAppGenerator(MessageBasedAppGenerator):
     @overload
@@ -130,7 +142,10 @@ class AgentChatAppGenerator(MessageBasedAppGenerator):
         # For implementation reference, see the `_parse_file` function and
         # `DraftWorkflowNodeRunApi` class which handle this properly.
         files = args.get("files") or []
-        file_extra_config = FileUploadConfigManager.convert(override_model_config_dict or app_model_config.to_dict())
+        if override_model_config_dict:
+            file_extra_config = FileUploadConfigManager.convert(override_model_config_dict)
+        else:
+            file_extra_config = FileUploadConfigManager.convert_app_model_config(app_model_config)
         if file_extra_config:
             file_objs = file_factory.build_from_mappings(
                 mappings=files,
@@ -153,7 +168,7 @@ class AgentChatAppGenerator(MessageBasedAppGenerator):
 
         # init application generate entity
         application_generate_entity = AgentChatAppGenerateEntity(
-            task_id=str(uuid.uuid4()),
+            task_id=uuid4_str(),
             app_config=app_config,
             model_conf=ModelConfigConverter.convert(app_config),
             file_upload_config=file_extra_config,
@@ -172,35 +187,45 @@ class AgentChatAppGenerator(MessageBasedAppGenerator):
             trace_manager=trace_manager,
         )
 
-        # init generate records
-        (conversation, message) = self._init_generate_records(application_generate_entity, conversation)
-
-        # init queue manager
-        queue_manager = MessageBasedAppQueueManager(
-            task_id=application_generate_entity.task_id,
-            user_id=application_generate_entity.user_id,
-            invoke_from=application_generate_entity.invoke_from,
-            conversation_id=conversation.id,
-            app_mode=conversation.mode,
-            message_id=message.id,
-        )
+        if not _generate_worker_slots.acquire(blocking=False):
+            raise AppInvokeQuotaExceededError(
+                "Too many requests. Please try again later. "
+                f"All {dify_config.APP_MAX_WORKERS} agent chat workers of this server are busy."
+            )
+        try:
+            # init generate records
+            (conversation, message) = self._init_generate_records(application_generate_entity, conversation)
 
-        # new thread with request context and contextvars
-        context = contextvars.copy_context()
-
-        worker_thread = threading.Thread(
-            target=self._generate_worker,
-            kwargs={
-                "flask_app": current_app._get_current_object(),  # type: ignore
-                "context": context,
-                "application_generate_entity": application_generate_entity,
-                "queue_manager": queue_manager,
-                "conversation_id": conversation.id,
-                "message_id": message.id,
-            },
-        )
+            # init queue manager
+            queue_manager = MessageBasedAppQueueManager(
+                task_id=application_generate_entity.task_id,
+                user_id=application_generate_entity.user_id,
+                invoke_from=application_generate_entity.invoke_from,
+                conversation_id=conversation.id,
+                app_mode=conversation.mode,
+                message_id=message.id,
+            )
 
-        worker_thread.start()
+            # run in a pooled thread inside a copy of the request contextvars, copying is O(1) and
+            # keeps values set by the worker from leaking into the next task of the same thread
+            context = contextvars.copy_context()
+            # the worker gets a new app context with its own `g`, so only the logged-in user is carried over
+            login_user = g._login_user if has_request_context() and "_login_user" in g else None
+
+            future = _generate_worker_pool.submit(
+                context.run,
+                self._generate_worker,
+                flask_app=current_app._get_current_object(),  # type: ignore
+                login_user=login_user,
+                application_generate_entity=application_generate_entity,
+                queue_manager=queue_manager,
+                conversation_id=conversation.id,
+                message_id=message.id,
+            )
+        except BaseException:
+            _generate_worker_slots.release()
+            raise
+        future.add_done_callback(_on_generate_worker_done)
 
         # return response or stream generator
         response = self._handle_response(
@@ -217,15 +242,16 @@ class AgentChatAppGenerator(MessageBasedAppGenerator):
     def _generate_worker(
         self,
         flask_app: Flask,
-        context: contextvars.Context,
+        login_user: Optional[Union[Account, EndUser]],
         application_generate_entity: AgentChatAppGenerateEntity,
         queue_manager: AppQueueManager,
         conversation_id: str,
         message_id: str,
     ) -> None:
         """
-        Generate worker in a new thread.
+        Generate worker in a pooled thread.
         :param flask_app: Flask app
+        :param login_user: logged-in user of the request, if any
         :param application_generate_entity: application generate entity
         :param queue_manager: queue manager
         :param conversation_id: conversation ID
@@ -233,7 +259,10 @@ class AgentChatAppGenerator(MessageBasedAppGenerator):
         :return:
         """
 
-        with preserve_flask_contexts(flask_app, context_vars=context):
+        with flask_app.app_context():
+            if login_user is not None:
+                g._login_user = login_user
+
             try:
                 # get conversation and message
                 conversation = self._get_conversation(conversation_id)
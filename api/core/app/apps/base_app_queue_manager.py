@@ -1,11 +1,12 @@
+import logging
 import queue
+import threading
 import time
+import weakref
 from abc import abstractmethod
 from enum import Enum
 from typing import Any, Optional
 
-from sqlalchemy.orm import DeclarativeMeta
-
 from configs import dify_config
 from core.app.entities.app_invoke_entities import InvokeFrom
 from core.app.entities.queue_entities import (
@@ -18,13 +19,72 @@ from core.app.entities.queue_entities import (
 )
 from extensions.ext_redis import redis_client
 
+logger = logging.getLogger(__name__)
+
+# invoke sources whose user is an account rather than an end user
+_ACCOUNT_INVOKE_FROMS = frozenset({InvokeFrom.EXPLORE, InvokeFrom.DEBUGGER})
+
 
 class PublishFrom(Enum):
     APPLICATION_MANAGER = 1
     TASK_PIPELINE = 2
 
 
+class _StopSignalListener:
+    """
+    Process-wide redis pub/sub subscriber that flips the local stop flag of queue managers,
+    so publishing an event does not need to poll the stop flag in redis.
+    """
+
+    _RESTART_INTERVAL = 60
+
+    def __init__(self) -> None:
+        self._queue_managers: weakref.WeakValueDictionary[str, AppQueueManager] = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = float("-inf")
+
+    def register(self, queue_manager: "AppQueueManager") -> None:
+        self._queue_managers[queue_manager._task_id] = queue_manager
+        with self._lock:
+            if self.is_alive():
+                return
+            # avoid restarting a failing subscriber on every request
+            if time.monotonic() - self._started_at > self._RESTART_INTERVAL:
+                self._started_at = time.monotonic()
+                self._thread = threading.Thread(target=self._listen, name="queue-manager-stop-listener", daemon=True)
+                self._thread.start()
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _listen(self) -> None:
+        channel_prefix = AppQueueManager._generate_stopped_cache_key("")
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(f"{channel_prefix}*")
+            for message in pubsub.listen():
+                if message.get("type") != "pmessage":
+                    continue
+                task_id = message["channel"].decode("utf-8").removeprefix(channel_prefix)
+                queue_manager = self._queue_managers.get(task_id)
+                if queue_manager is not None and not queue_manager._stopped:
+                    queue_manager._stopped = True
+                    # wake up the consumer blocked in listen(), the producer may not publish anything anymore
+                    queue_manager.publish(
+                        QueueStopEvent(stopped_by=QueueStopEvent.StopBy.USER_MANUAL), PublishFrom.TASK_PIPELINE
+                    )
+        except Exception:
+            # queue managers fall back to polling the stop flag in redis
+            logger.exception("Stop signal listener exited")
+
+
 class AppQueueManager:
+    # how often the stop flag in redis is polled in case the stop signal was missed
+    _STOP_FLAG_CHECK_INTERVAL = 1
+    # max number of already queued messages yielded before checking timeout and ping again
+    _LISTEN_BATCH_SIZE = 16
+
     def __init__(self, task_id: str, user_id: str, invoke_from: InvokeFrom) -> None:
         if not user_id:
             raise ValueError("user is required")
@@ -33,15 +93,19 @@ class AppQueueManager:
         self._user_id = user_id
         self._invoke_from = invoke_from
 
-        user_prefix = "account" if self._invoke_from in {InvokeFrom.EXPLORE, InvokeFrom.DEBUGGER} else "end-user"
-        redis_client.setex(
-            AppQueueManager._generate_task_belong_cache_key(self._task_id), 1800, f"{user_prefix}-{self._user_id}"
-        )
+        self._user_prefix = "account" if self._invoke_from in _ACCOUNT_INVOKE_FROMS else "end-user"
+        self._task_belong_cache_key = AppQueueManager._generate_task_belong_cache_key(self._task_id)
+        self._stopped_cache_key = AppQueueManager._generate_stopped_cache_key(self._task_id)
+        redis_client.setex(self._task_belong_cache_key, 1800, f"{self._user_prefix}-{self._user_id}")
 
         q: queue.Queue[WorkflowQueueMessage | MessageQueueMessage | None] = queue.Queue()
 
         self._q = q
 
+        self._stopped = False
+        self._last_stop_check_time = time.monotonic()
+        _stop_signal_listener.register(self)
+
     def listen(self):
         """
         Listen to queue
@@ -49,29 +113,44 @@ class AppQueueManager:
         """
         # wait for APP_MAX_EXECUTION_TIME seconds to stop listen
         listen_timeout = dify_config.APP_MAX_EXECUTION_TIME
-        start_time = time.time()
+        start_time = time.monotonic()
         last_ping_time: int | float = 0
         while True:
+            # block until the next ping or the listen timeout, the stop signal listener wakes us up with a stop event.
+            # without it, poll the stop flag per check interval, a stopped producer publishes nothing to wake us up
+            next_deadline = min(start_time + (last_ping_time + 1) * 10, start_time + listen_timeout)
+            timeout = max(0.0, next_deadline - time.monotonic())
+            if not self._stopped and not _stop_signal_listener.is_alive():
+                timeout = min(timeout, self._STOP_FLAG_CHECK_INTERVAL)
             try:
-                message = self._q.get(timeout=1)
-                if message is None:
-                    break
-
-                yield message
+                message = self._q.get(timeout=timeout)
             except queue.Empty:
-                continue
-            finally:
-                elapsed_time = time.time() - start_time
-                if elapsed_time >= listen_timeout or self._is_stopped():
-                    # publish two messages to make sure the client can receive the stop signal
-                    # and stop listening after the stop signal processed
-                    self.publish(
-                        QueueStopEvent(stopped_by=QueueStopEvent.StopBy.USER_MANUAL), PublishFrom.TASK_PIPELINE
-                    )
-
-                if elapsed_time // 10 > last_ping_time:
-                    self.publish(QueuePingEvent(), PublishFrom.TASK_PIPELINE)
-                    last_ping_time = elapsed_time // 10
+                pass
+            else:
+                # drain messages that are already queued without going through the timed wait again
+                batch_size = 1
+                while True:
+                    if message is None:
+                        return
+
+                    yield message
+                    if batch_size >= self._LISTEN_BATCH_SIZE:
+                        break
+                    try:
+                        message = self._q.get_nowait()
+                    except queue.Empty:
+                        break
+                    batch_size += 1
+
+            elapsed_time = time.monotonic() - start_time
+            if elapsed_time >= listen_timeout or self._is_stopped():
+                # publish two messages to make sure the client can receive the stop signal
+                # and stop listening after the stop signal processed
+                self.publish(QueueStopEvent(stopped_by=QueueStopEvent.StopBy.USER_MANUAL), PublishFrom.TASK_PIPELINE)
+
+            if elapsed_time // 10 > last_ping_time:
+                self.publish(QueuePingEvent(), PublishFrom.TASK_PIPELINE)
+                last_ping_time = elapsed_time // 10
 
     def stop_listen(self) -> None:
         """
@@ -96,7 +175,6 @@ class AppQueueManager:
         :param pub_from:
         :return:
         """
-        self._check_for_sqlalchemy_models(event.model_dump())
         self._publish(event, pub_from)
 
     @abstractmethod
@@ -119,21 +197,33 @@ class AppQueueManager:
         if result is None:
             return
 
-        user_prefix = "account" if invoke_from in {InvokeFrom.EXPLORE, InvokeFrom.DEBUGGER} else "end-user"
+        user_prefix = "account" if invoke_from in _ACCOUNT_INVOKE_FROMS else "end-user"
         if result.decode("utf-8") != f"{user_prefix}-{user_id}":
             return
 
         stopped_cache_key = cls._generate_stopped_cache_key(task_id)
         redis_client.setex(stopped_cache_key, 600, 1)
+        # notify the process running the task, the cache key is also used as the channel name.
+        # not pipelined with the flag, redis cluster pipelines reject publish
+        redis_client.publish(stopped_cache_key, 1)
 
     def _is_stopped(self) -> bool:
         """
         Check if task is stopped
         :return:
         """
-        stopped_cache_key = AppQueueManager._generate_stopped_cache_key(self._task_id)
-        result = redis_client.get(stopped_cache_key)
+        if self._stopped:
+            return True
+
+        # the stop flag is normally set by the stop signal listener, only poll redis as a fallback
+        now = time.monotonic()
+        if now - self._last_stop_check_time < self._STOP_FLAG_CHECK_INTERVAL:
+            return False
+        self._last_stop_check_time = now
+
+        result = redis_client.get(self._stopped_cache_key)
         if result is not None:
+            self._stopped = True
             return True
 
         return False
@@ -156,16 +246,5 @@ class AppQueueManager:
         """
         return f"generate_task_stopped:{task_id}"
 
-    def _check_for_sqlalchemy_models(self, data: Any):
-        # from entity to dict or list
-        if isinstance(data, dict):
-            for key, value in data.items():
-                self._check_for_sqlalchemy_models(value)
-        elif isinstance(data, list):
-            for item in data:
-                self._check_for_sqlalchemy_models(item)
-        else:
-            if isinstance(data, DeclarativeMeta) or hasattr(data, "_sa_instance_state"):
-                raise TypeError(
-                    "Critical Error: Passing SQLAlchemy Model instances that cause thread safety issues is not allowed."
-                )
+
+_stop_signal_listener = _StopSignalListener()
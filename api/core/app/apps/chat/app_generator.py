@@ -121,7 +121,10 @@ class ChatAppGenerator(MessageBasedAppGenerator):
         # For implementation reference, see the `_parse_file` function and
         # `DraftWorkflowNodeRunApi` class which handle this properly.
         files = args["files"] if args.get("files") else []
-        file_extra_config = FileUploadConfigManager.convert(override_model_config_dict or app_model_config.to_dict())
+        if override_model_config_dict:
+            file_extra_config = FileUploadConfigManager.convert(override_model_config_dict)
+        else:
+            file_extra_config = FileUploadConfigManager.convert_app_model_config(app_model_config)
         if file_extra_config:
             file_objs = file_factory.build_from_mappings(
                 mappings=files,
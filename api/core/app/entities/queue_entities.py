@@ -1,9 +1,10 @@
 from collections.abc import Mapping, Sequence
 from datetime import datetime
 from enum import Enum, StrEnum
-from typing import Any, Optional
+from typing import Any, ClassVar, Optional, Self, get_args
 
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
+from sqlalchemy.orm import DeclarativeMeta
 
 from core.model_runtime.entities.llm_entities import LLMResult, LLMResultChunk
 from core.rag.entities.citation_metadata import RetrievalSourceMetadata
@@ -53,6 +54,41 @@ class QueueEvent(StrEnum):
     RETRY = "retry"
 
 
+def _may_contain_any(annotation: Any, seen: set[type[BaseModel]]) -> bool:
+    """
+    Check whether a field annotation can hold arbitrary objects, looking into nested models
+    """
+    if annotation is Any:
+        return True
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        if annotation in seen:
+            return False
+        seen.add(annotation)
+        return any(_may_contain_any(field.annotation, seen) for field in annotation.model_fields.values())
+    return any(_may_contain_any(arg, seen) for arg in get_args(annotation))
+
+
+def _check_for_sqlalchemy_models(data: Any) -> None:
+    stack: list[Any] = [data]
+    seen: set[int] = set()
+    while stack:
+        data = stack.pop()
+        if id(data) in seen:
+            continue
+        seen.add(id(data))
+
+        if isinstance(data, Mapping):
+            stack.extend(data.values())
+        elif isinstance(data, list | tuple):
+            stack.extend(data)
+        elif isinstance(data, BaseModel):
+            stack.extend(vars(data).values())
+        elif DeclarativeMeta in type(data).__mro__ or hasattr(data, "_sa_instance_state"):
+            raise TypeError(
+                "Critical Error: Passing SQLAlchemy Model instances that cause thread safety issues is not allowed."
+            )
+
+
 class AppQueueEvent(BaseModel):
     """
     QueueEvent abstract entity
@@ -60,6 +96,22 @@ class AppQueueEvent(BaseModel):
 
     event: QueueEvent
 
+    # fields that are not fully typed and may carry SQLAlchemy models, resolved once per event class
+    _untyped_fields: ClassVar[tuple[str, ...]] = ()
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any) -> None:
+        super().__pydantic_init_subclass__(**kwargs)
+        cls._untyped_fields = tuple(
+            name for name, field in cls.model_fields.items() if _may_contain_any(field.annotation, set())
+        )
+
+    @model_validator(mode="after")
+    def check_for_sqlalchemy_models(self) -> Self:
+        for name in self._untyped_fields:
+            _check_for_sqlalchemy_models(getattr(self, name))
+        return self
+
 
 class QueueLLMChunkEvent(AppQueueEvent):
     """
@@ -1,29 +1,73 @@
 import logging
+import threading
 import time
-import uuid
 from collections.abc import Generator, Mapping
 from datetime import timedelta
 from typing import Any, Optional, Union
 
+from cachetools import LRUCache
+
 from core.errors.error import AppInvokeQuotaExceededError
 from extensions.ext_redis import redis_client
+from libs.uuid_utils import uuid4_str
 
 logger = logging.getLogger(__name__)
 
 
 class RateLimit:
+    __slots__ = (
+        "max_active_requests",
+        "initialized",
+        "client_id",
+        "active_requests_key",
+        "max_active_requests_key",
+        "last_recalculate_time",
+        "last_sync_time",
+        "_flush_active_requests",
+        "_enter",
+    )
+
     _MAX_ACTIVE_REQUESTS_KEY = "dify:rate_limit:{}:max_active_requests"
     _ACTIVE_REQUESTS_KEY = "dify:rate_limit:{}:active_requests"
     _UNLIMITED_REQUEST_ID = "unlimited_request_id"
     _REQUEST_MAX_ALIVE_TIME = 10 * 60  # 10 minutes
     _ACTIVE_REQUESTS_COUNT_FLUSH_INTERVAL = 5 * 60  # recalculate request_count from request_detail every 5 minutes
-    _instance_dict: dict[str, "RateLimit"] = {}
+    _MAX_ACTIVE_REQUESTS_SYNC_INTERVAL = 60 * 60  # re-read max_active_requests from redis every hour
+    # bounded so that long-running workers do not keep an instance for every client ever seen,
+    # an evicted instance is simply re-created since its state lives in redis
+    _instance_dict: LRUCache[str, "RateLimit"] = LRUCache(maxsize=10000)
+    _instance_lock = threading.Lock()
+    # drop timed-out requests from the in-transit request list in a single round-trip
+    _FLUSH_ACTIVE_REQUESTS_SCRIPT = """
+        local now = tonumber(ARGV[1])
+        local max_alive_time = tonumber(ARGV[2])
+        local request_details = redis.call('HGETALL', KEYS[1])
+        local removed = 0
+        for i = 1, #request_details, 2 do
+            if now - tonumber(request_details[i + 1]) > max_alive_time then
+                redis.call('HDEL', KEYS[1], request_details[i])
+                removed = removed + 1
+            end
+        end
+        redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+        return removed
+    """
+    # admit a request only if the in-transit request list is below the limit, atomically
+    _ENTER_SCRIPT = """
+        if redis.call('HLEN', KEYS[1]) >= tonumber(ARGV[1]) then
+            return 0
+        end
+        redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+        return 1
+    """
 
     def __new__(cls: type["RateLimit"], client_id: str, max_active_requests: int):
-        if client_id not in cls._instance_dict:
-            instance = super().__new__(cls)
-            cls._instance_dict[client_id] = instance
-        return cls._instance_dict[client_id]
+        with cls._instance_lock:
+            instance = cls._instance_dict.get(client_id)
+            if instance is None:
+                instance = super().__new__(cls)
+                cls._instance_dict[client_id] = instance
+        return instance
 
     def __init__(self, client_id: str, max_active_requests: int):
         self.max_active_requests = max_active_requests
@@ -37,31 +81,31 @@ class RateLimit:
         self.active_requests_key = self._ACTIVE_REQUESTS_KEY.format(client_id)
         self.max_active_requests_key = self._MAX_ACTIVE_REQUESTS_KEY.format(client_id)
         self.last_recalculate_time = float("-inf")
+        self.last_sync_time = float("-inf")
+        self._flush_active_requests = redis_client.register_script(self._FLUSH_ACTIVE_REQUESTS_SCRIPT)
+        self._enter = redis_client.register_script(self._ENTER_SCRIPT)
         self.flush_cache(use_local_value=True)
 
     def flush_cache(self, use_local_value=False):
         if self.disabled():
             return
-        self.last_recalculate_time = time.time()
-        # flush max active requests
-        if use_local_value or not redis_client.exists(self.max_active_requests_key):
-            redis_client.setex(self.max_active_requests_key, timedelta(days=1), self.max_active_requests)
-        else:
-            self.max_active_requests = int(redis_client.get(self.max_active_requests_key).decode("utf-8"))
-            redis_client.expire(self.max_active_requests_key, timedelta(days=1))
+        now = time.time()
+        self.last_recalculate_time = now
+        # flush max active requests, it rarely changes so the local value is reused between syncs
+        if use_local_value or now - self.last_sync_time > RateLimit._MAX_ACTIVE_REQUESTS_SYNC_INTERVAL:
+            max_active_requests = None if use_local_value else redis_client.get(self.max_active_requests_key)
+            if max_active_requests is None:
+                redis_client.setex(self.max_active_requests_key, timedelta(days=1), self.max_active_requests)
+            else:
+                self.max_active_requests = int(max_active_requests.decode("utf-8"))
+                redis_client.expire(self.max_active_requests_key, timedelta(days=1))
+            self.last_sync_time = now
 
         # flush max active requests (in-transit request list)
-        if not redis_client.exists(self.active_requests_key):
-            return
-        request_details = redis_client.hgetall(self.active_requests_key)
-        redis_client.expire(self.active_requests_key, timedelta(days=1))
-        timeout_requests = [
-            k
-            for k, v in request_details.items()
-            if time.time() - float(v.decode("utf-8")) > RateLimit._REQUEST_MAX_ALIVE_TIME
-        ]
-        if timeout_requests:
-            redis_client.hdel(self.active_requests_key, *timeout_requests)
+        self._flush_active_requests(
+            keys=[self.active_requests_key],
+            args=[now, RateLimit._REQUEST_MAX_ALIVE_TIME, int(timedelta(days=1).total_seconds())],
+        )
 
     def enter(self, request_id: Optional[str] = None) -> str:
         if self.disabled():
@@ -71,13 +115,15 @@ class RateLimit:
         if not request_id:
             request_id = RateLimit.gen_request_key()
 
-        active_requests_count = redis_client.hlen(self.active_requests_key)
-        if active_requests_count >= self.max_active_requests:
+        admitted = self._enter(
+            keys=[self.active_requests_key],
+            args=[self.max_active_requests, request_id, str(time.time())],
+        )
+        if not admitted:
             raise AppInvokeQuotaExceededError(
                 f"Too many requests. Please try again later. The current maximum concurrent requests allowed "
                 f"for {self.client_id} is {self.max_active_requests}."
             )
-        redis_client.hset(self.active_requests_key, request_id, str(time.time()))
         return request_id
 
     def exit(self, request_id: str):
@@ -90,7 +136,7 @@ class RateLimit:
 
     @staticmethod
     def gen_request_key() -> str:
-        return str(uuid.uuid4())
+        return uuid4_str()
 
     def generate(self, generator: Union[Generator[str, None, None], Mapping[str, Any]], request_id: str):
         if isinstance(generator, Mapping):
@@ -100,6 +146,8 @@ class RateLimit:
 
 
 class RateLimitGenerator:
+    __slots__ = ("rate_limit", "generator", "request_id", "closed")
+
     def __init__(self, rate_limit: RateLimit, generator: Generator[str, None, None], request_id: str):
         self.rate_limit = rate_limit
         self.generator = generator
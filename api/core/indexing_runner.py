@@ -46,8 +46,12 @@ class IndexingRunner:
         self.storage = storage
         self.model_manager = ModelManager()
 
-    def run(self, dataset_documents: list[DatasetDocument]):
-        """Run the indexing process."""
+    def run(
+        self,
+        dataset_documents: list[DatasetDocument],
+        extracted_text_docs: Optional[dict[str, list[Document]]] = None,
+    ):
+        """Run the indexing process, documents whose id is in extracted_text_docs skip extraction."""
         for dataset_document in dataset_documents:
             try:
                 # get dataset
@@ -67,7 +71,10 @@ class IndexingRunner:
                 index_type = dataset_document.doc_form
                 index_processor = IndexProcessorFactory(index_type).init_index_processor()
                 # extract
-                text_docs = self._extract(index_processor, dataset_document, processing_rule.to_dict())
+                if extracted_text_docs is not None and dataset_document.id in extracted_text_docs:
+                    text_docs = extracted_text_docs[dataset_document.id]
+                else:
+                    text_docs = self._extract(index_processor, dataset_document, processing_rule.to_dict())
 
                 # transform
                 documents = self._transform(
@@ -99,6 +106,18 @@ class IndexingRunner:
                 dataset_document.stopped_at = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
                 db.session.commit()
 
+    def extract(self, dataset_document: DatasetDocument) -> list[Document]:
+        """Extract the text of a document ahead of run, e.g. while its previous index is being cleaned."""
+        processing_rule = (
+            db.session.query(DatasetProcessRule)
+            .where(DatasetProcessRule.id == dataset_document.dataset_process_rule_id)
+            .first()
+        )
+        if not processing_rule:
+            raise ValueError("no process rule found")
+        index_processor = IndexProcessorFactory(dataset_document.doc_form).init_index_processor()
+        return self._extract(index_processor, dataset_document, processing_rule.to_dict())
+
     def run_in_splitting_status(self, dataset_document: DatasetDocument):
         """Run the indexing process when the index_status is splitting."""
         try:
@@ -1,16 +1,28 @@
 import re
 
+# invalid symbols removed by the default clean, including Unicode U+FFFE
+_INVALID_SYMBOL_TABLE = dict.fromkeys(
+    [*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F, 0xEF, 0xBF, 0xBE, 0xFFFE]
+)
+
+_EXTRA_NEWLINES_PATTERN = re.compile(r"\n{3,}")
+_EXTRA_SPACES_PATTERN = re.compile(r"[\t\f\r\x20\u00a0\u1680\u180e\u2000-\u200a\u202f\u205f\u3000]{2,}")
+_EMAIL_PATTERN = re.compile(r"([a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9.-]+)")
+# markdown images (capturing the image URL) or any other URL, matched in a single pass
+_URL_OR_MARKDOWN_IMAGE_PATTERN = re.compile(r"!\[.*?\]\((https?://[^\s)]+)\)|https?://[^\s)]+")
+
+
+def _keep_markdown_image_url(match) -> str:
+    image_url = match.group(1)
+    return f"![image]({image_url})" if image_url else ""
+
 
 class CleanProcessor:
     @classmethod
     def clean(cls, text: str, process_rule: dict) -> str:
         # default clean
         # remove invalid symbol
-        text = re.sub(r"<\|", "<", text)
-        text = re.sub(r"\|>", ">", text)
-        text = re.sub(r"[\x00-\x08\x0B\x0C\x0E-\x1F\x7F\xEF\xBF\xBE]", "", text)
-        # Unicode  U+FFFE
-        text = re.sub("\ufffe", "", text)
+        text = text.replace("<|", "<").replace("|>", ">").translate(_INVALID_SYMBOL_TABLE)
 
         rules = process_rule["rules"] if process_rule else {}
         if "pre_processing_rules" in rules:
@@ -18,35 +30,14 @@ class CleanProcessor:
             for pre_processing_rule in pre_processing_rules:
                 if pre_processing_rule["id"] == "remove_extra_spaces" and pre_processing_rule["enabled"] is True:
                     # Remove extra spaces
-                    pattern = r"\n{3,}"
-                    text = re.sub(pattern, "\n\n", text)
-                    pattern = r"[\t\f\r\x20\u00a0\u1680\u180e\u2000-\u200a\u202f\u205f\u3000]{2,}"
-                    text = re.sub(pattern, " ", text)
+                    text = _EXTRA_NEWLINES_PATTERN.sub("\n\n", text)
+                    text = _EXTRA_SPACES_PATTERN.sub(" ", text)
                 elif pre_processing_rule["id"] == "remove_urls_emails" and pre_processing_rule["enabled"] is True:
                     # Remove email
-                    pattern = r"([a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+)"
-                    text = re.sub(pattern, "", text)
+                    text = _EMAIL_PATTERN.sub("", text)
 
                     # Remove URL but keep Markdown image URLs
-                    # First, temporarily replace Markdown image URLs with a placeholder
-                    markdown_image_pattern = r"!\[.*?\]\((https?://[^\s)]+)\)"
-                    placeholders: list[str] = []
-
-                    def replace_with_placeholder(match, placeholders=placeholders):
-                        url = match.group(1)
-                        placeholder = f"__MARKDOWN_IMAGE_URL_{len(placeholders)}__"
-                        placeholders.append(url)
-                        return f"![image]({placeholder})"
-
-                    text = re.sub(markdown_image_pattern, replace_with_placeholder, text)
-
-                    # Now remove all remaining URLs
-                    url_pattern = r"https?://[^\s)]+"
-                    text = re.sub(url_pattern, "", text)
-
-                    # Finally, restore the Markdown image URLs
-                    for i, url in enumerate(placeholders):
-                        text = text.replace(f"__MARKDOWN_IMAGE_URL_{i}__", url)
+                    text = _URL_OR_MARKDOWN_IMAGE_PATTERN.sub(_keep_markdown_image_url, text)
         return text
 
     def filter_string(self, text):
@@ -1,9 +1,8 @@
-import base64
 import logging
 from typing import Any, Optional, cast
 
 import numpy as np
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert
 
 from configs import dify_config
 from core.entities.embedding_type import EmbeddingInputType
@@ -19,80 +18,91 @@ from models.dataset import Embedding
 logger = logging.getLogger(__name__)
 
 
+def _normalize(vector: list[float]) -> list[float]:
+    # sqrt of the dot product skips the generic dispatch of np.linalg.norm for a single vector
+    array = np.asarray(vector, dtype=np.float64)
+    normalized: list[float] = (array / np.sqrt(np.dot(array, array))).tolist()
+    return normalized
+
+
 class CacheEmbedding(Embeddings):
     def __init__(self, model_instance: ModelInstance, user: Optional[str] = None) -> None:
         self._model_instance = model_instance
         self._user = user
+        self._max_chunks: Optional[int] = None
 
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
         """Embed search docs in batches of 10."""
         # use doc embedding cache or store if not exists
-        text_embeddings: list[Any] = [None for _ in range(len(texts))]
-        embedding_queue_indices = []
-        for i, text in enumerate(texts):
-            hash = helper.generate_text_hash(text)
-            embedding = (
-                db.session.query(Embedding)
-                .filter_by(
-                    model_name=self._model_instance.model, hash=hash, provider_name=self._model_instance.provider
-                )
-                .first()
+        hashes = [helper.generate_text_hash(text) for text in texts]
+        # look up the cached embeddings of all texts in a single query
+        cached_embeddings: dict[str, Any] = {
+            embedding.hash: embedding.get_embedding()
+            for embedding in db.session.query(Embedding).filter(
+                Embedding.model_name == self._model_instance.model,
+                Embedding.provider_name == self._model_instance.provider,
+                Embedding.hash.in_(set(hashes)),
             )
-            if embedding:
-                text_embeddings[i] = embedding.get_embedding()
-            else:
+        }
+        text_embeddings: list[Any] = [cached_embeddings.get(hash) for hash in hashes]
+        # identical texts are only embedded once
+        embedding_queue_indices = []
+        queued_hashes = set()
+        for i, hash in enumerate(hashes):
+            if text_embeddings[i] is None and hash not in queued_hashes:
+                queued_hashes.add(hash)
                 embedding_queue_indices.append(i)
         if embedding_queue_indices:
-            embedding_queue_texts = [texts[i] for i in embedding_queue_indices]
-            embedding_queue_embeddings = []
+            embedding_queue_embeddings: list[tuple[int, list[float]]] = []
             try:
-                model_type_instance = cast(TextEmbeddingModel, self._model_instance.model_type_instance)
-                model_schema = model_type_instance.get_model_schema(
-                    self._model_instance.model, self._model_instance.credentials
-                )
-                max_chunks = (
-                    model_schema.model_properties[ModelPropertyKey.MAX_CHUNKS]
-                    if model_schema and ModelPropertyKey.MAX_CHUNKS in model_schema.model_properties
-                    else 1
-                )
-                for i in range(0, len(embedding_queue_texts), max_chunks):
-                    batch_texts = embedding_queue_texts[i : i + max_chunks]
+                max_chunks = self._get_max_chunks()
+                for i in range(0, len(embedding_queue_indices), max_chunks):
+                    batch_indices = embedding_queue_indices[i : i + max_chunks]
 
                     embedding_result = self._model_instance.invoke_text_embedding(
-                        texts=batch_texts, user=self._user, input_type=EmbeddingInputType.DOCUMENT
+                        texts=[texts[index] for index in batch_indices],
+                        user=self._user,
+                        input_type=EmbeddingInputType.DOCUMENT,
                     )
 
-                    for vector in embedding_result.embeddings:
-                        try:
-                            # FIXME: type ignore for numpy here
-                            normalized_embedding = (vector / np.linalg.norm(vector)).tolist()  # type: ignore
-                            # stackoverflow best way: https://stackoverflow.com/questions/20319813/how-to-check-list-containing-nan
-                            if np.isnan(normalized_embedding).any():
-                                # for issue #11827  float values are not json compliant
-                                logger.warning("Normalized embedding is nan: %s", normalized_embedding)
-                                continue
-                            embedding_queue_embeddings.append(normalized_embedding)
-                        except IntegrityError:
-                            db.session.rollback()
-                        except Exception:
-                            logging.exception("Failed transform embedding")
-                cache_embeddings = []
-                try:
-                    for i, n_embedding in zip(embedding_queue_indices, embedding_queue_embeddings):
-                        text_embeddings[i] = n_embedding
-                        hash = helper.generate_text_hash(texts[i])
-                        if hash not in cache_embeddings:
-                            embedding_cache = Embedding(
-                                model_name=self._model_instance.model,
-                                hash=hash,
-                                provider_name=self._model_instance.provider,
-                            )
-                            embedding_cache.set_embedding(n_embedding)
-                            db.session.add(embedding_cache)
-                            cache_embeddings.append(hash)
+                    # normalize the whole batch at once
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        batch_embeddings = np.asarray(embedding_result.embeddings, dtype=np.float64)
+                        batch_embeddings /= np.linalg.norm(batch_embeddings, axis=1, keepdims=True)
+                    # for issue #11827  float values are not json compliant
+                    nan_rows = np.isnan(batch_embeddings).any(axis=1)
+                    if nan_rows.any():
+                        logger.warning(
+                            "Normalized embedding is nan for %s of %s texts", int(nan_rows.sum()), len(batch_indices)
+                        )
+                    for index, normalized_embedding, is_nan in zip(
+                        batch_indices, batch_embeddings.tolist(), nan_rows.tolist()
+                    ):
+                        if not is_nan:
+                            embedding_queue_embeddings.append((index, normalized_embedding))
+                embedding_caches = []
+                for i, n_embedding in embedding_queue_embeddings:
+                    hash = hashes[i]
+                    cached_embeddings[hash] = n_embedding
+                    embedding_caches.append(
+                        {
+                            "model_name": self._model_instance.model,
+                            "hash": hash,
+                            "provider_name": self._model_instance.provider,
+                            "embedding": Embedding.encode_embedding(n_embedding),
+                        }
+                    )
+                if embedding_caches:
+                    # bulk insert, skipping embeddings cached concurrently by another worker
+                    stmt = insert(Embedding).on_conflict_do_nothing(
+                        index_elements=["model_name", "hash", "provider_name"]
+                    )
+                    db.session.execute(stmt, embedding_caches)
                     db.session.commit()
-                except IntegrityError:
-                    db.session.rollback()
+                # fill in the embeddings of the queued texts and their duplicates
+                for i, hash in enumerate(hashes):
+                    if text_embeddings[i] is None:
+                        text_embeddings[i] = cached_embeddings.get(hash)
             except Exception as ex:
                 db.session.rollback()
                 logger.exception("Failed to embed documents: %s")
@@ -100,24 +110,37 @@ class CacheEmbedding(Embeddings):
 
         return text_embeddings
 
+    def _get_max_chunks(self) -> int:
+        """Get the max number of texts per embedding request, the model schema is only fetched once."""
+        if self._max_chunks is None:
+            model_type_instance = cast(TextEmbeddingModel, self._model_instance.model_type_instance)
+            model_schema = model_type_instance.get_model_schema(
+                self._model_instance.model, self._model_instance.credentials
+            )
+            self._max_chunks = (
+                model_schema.model_properties[ModelPropertyKey.MAX_CHUNKS]
+                if model_schema and ModelPropertyKey.MAX_CHUNKS in model_schema.model_properties
+                else 1
+            )
+        return self._max_chunks
+
     def embed_query(self, text: str) -> list[float]:
         """Embed query text."""
         # use doc embedding cache or store if not exists
         hash = helper.generate_text_hash(text)
-        embedding_cache_key = f"{self._model_instance.provider}_{self._model_instance.model}_{hash}"
-        embedding = redis_client.get(embedding_cache_key)
+        # cached as raw float32 bytes, the precision loss is far below what similarity search can tell apart
+        embedding_cache_key = f"f32_raw_{self._model_instance.provider}_{self._model_instance.model}_{hash}"
+        # read and refresh the expiry in one round-trip
+        embedding = redis_client.getex(embedding_cache_key, ex=600)
         if embedding:
-            redis_client.expire(embedding_cache_key, 600)
-            decoded_embedding = np.frombuffer(base64.b64decode(embedding), dtype="float")
-            return [float(x) for x in decoded_embedding]
+            decoded_embedding: list[float] = np.frombuffer(embedding, dtype=np.float32).tolist()
+            return decoded_embedding
         try:
             embedding_result = self._model_instance.invoke_text_embedding(
                 texts=[text], user=self._user, input_type=EmbeddingInputType.QUERY
             )
 
-            embedding_results = embedding_result.embeddings[0]
-            # FIXME: type ignore for numpy here
-            embedding_results = (embedding_results / np.linalg.norm(embedding_results)).tolist()  # type: ignore
+            embedding_results = _normalize(embedding_result.embeddings[0])
             if np.isnan(embedding_results).any():
                 raise ValueError("Normalized embedding is nan please try again")
         except Exception as ex:
@@ -126,14 +149,8 @@ class CacheEmbedding(Embeddings):
             raise ex
 
         try:
-            # encode embedding to base64
-            embedding_vector = np.array(embedding_results)
-            vector_bytes = embedding_vector.tobytes()
-            # Transform to Base64
-            encoded_vector = base64.b64encode(vector_bytes)
-            # Transform to string
-            encoded_str = encoded_vector.decode("utf-8")
-            redis_client.setex(embedding_cache_key, 600, encoded_str)
+            vector_bytes = np.asarray(embedding_results, dtype=np.float32).tobytes()
+            redis_client.setex(embedding_cache_key, 600, vector_bytes)
         except Exception as ex:
             if dify_config.DEBUG:
                 logging.exception(
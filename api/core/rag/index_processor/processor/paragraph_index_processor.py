@@ -1,6 +1,5 @@
 """Paragraph index processor."""
 
-import uuid
 from typing import Optional
 
 from core.rag.cleaner.clean_processor import CleanProcessor
@@ -13,6 +12,7 @@ from core.rag.index_processor.index_processor_base import BaseIndexProcessor
 from core.rag.models.document import Document
 from core.tools.utils.text_processing_utils import remove_leading_symbols
 from libs import helper
+from libs.uuid_utils import uuid4_str
 from models.dataset import Dataset, DatasetProcessRule
 from services.entities.knowledge_entities.knowledge_entities import Rule
 
@@ -49,27 +49,23 @@ class ParagraphIndexProcessor(BaseIndexProcessor):
             separator=rules.segmentation.separator,
             embedding_model_instance=kwargs.get("embedding_model_instance"),
         )
-        all_documents = []
         for document in documents:
             # document clean
-            document_text = CleanProcessor.clean(document.page_content, kwargs.get("process_rule", {}))
-            document.page_content = document_text
-            # parse document to nodes
-            document_nodes = splitter.split_documents([document])
-            split_documents = []
-            for document_node in document_nodes:
-                if document_node.page_content.strip():
-                    doc_id = str(uuid.uuid4())
-                    hash = helper.generate_text_hash(document_node.page_content)
-                    if document_node.metadata is not None:
-                        document_node.metadata["doc_id"] = doc_id
-                        document_node.metadata["doc_hash"] = hash
-                    # delete Splitter character
-                    page_content = remove_leading_symbols(document_node.page_content).strip()
-                    if len(page_content) > 0:
-                        document_node.page_content = page_content
-                        split_documents.append(document_node)
-            all_documents.extend(split_documents)
+            document.page_content = CleanProcessor.clean(document.page_content, kwargs.get("process_rule", {}))
+        # parse all documents to nodes at once, nodes keep the order of their documents
+        all_documents = []
+        for document_node in splitter.split_documents(documents):
+            if document_node.page_content.strip():
+                doc_id = uuid4_str()
+                hash = helper.generate_text_hash(document_node.page_content)
+                if document_node.metadata is not None:
+                    document_node.metadata["doc_id"] = doc_id
+                    document_node.metadata["doc_hash"] = hash
+                # delete Splitter character
+                page_content = remove_leading_symbols(document_node.page_content).strip()
+                if len(page_content) > 0:
+                    document_node.page_content = page_content
+                    all_documents.append(document_node)
         return all_documents
 
     def load(self, dataset: Dataset, documents: list[Document], with_keywords: bool = True, **kwargs):
@@ -121,9 +117,9 @@ class ParagraphIndexProcessor(BaseIndexProcessor):
         # Organize results.
         docs = []
         for result in results:
-            metadata = result.metadata
-            metadata["score"] = result.score
+            # only annotate the results that are kept
             if result.score > score_threshold:
-                doc = Document(page_content=result.page_content, metadata=metadata)
-                docs.append(doc)
+                metadata = result.metadata
+                metadata["score"] = result.score
+                docs.append(Document(page_content=result.page_content, metadata=metadata))
         return docs
@@ -1,5 +1,9 @@
 import re
 
+# Match Unicode ranges for punctuation and symbols
+# FIXME this pattern is confused quick fix for #11868 maybe refactor it later
+_LEADING_SYMBOLS_PATTERN = re.compile(r"^[\u2000-\u206F\u2E00-\u2E7F\u3000-\u303F!\"#$%&'()*+,./:;<=>?@^_`~]+")
+
 
 def remove_leading_symbols(text: str) -> str:
     """
@@ -11,7 +15,5 @@ def remove_leading_symbols(text: str) -> str:
     Returns:
         str: The text with leading punctuation or symbols removed.
     """
-    # Match Unicode ranges for punctuation and symbols
-    # FIXME this pattern is confused quick fix for #11868 maybe refactor it later
-    pattern = r"^[\u2000-\u206F\u2E00-\u2E7F\u3000-\u303F!\"#$%&'()*+,./:;<=>?@^_`~]+"
-    return re.sub(pattern, "", text)
+    match = _LEADING_SYMBOLS_PATTERN.match(text)
+    return text[match.end() :] if match else text
@@ -16,6 +16,7 @@ from configs import dify_config
 from dify_app import DifyApp
 
 if TYPE_CHECKING:
+    from redis.commands.core import Script
     from redis.lock import Lock
 
 logger = logging.getLogger(__name__)
@@ -106,6 +107,8 @@ class RedisClientWrapper:
         def zremrangebyscore(self, name: str | bytes, min: float | str, max: float | str) -> Any: ...
         def zcard(self, name: str | bytes) -> Any: ...
         def getdel(self, name: str | bytes) -> Any: ...
+        def getex(self, name: str | bytes, ex: int | timedelta | None = None) -> Any: ...
+        def register_script(self, script: str | bytes) -> Script: ...
 
     def __getattr__(self, item: str) -> Any:
         if self._client is None:
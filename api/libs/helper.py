@@ -24,6 +24,8 @@ from core.model_runtime.utils.encoders import jsonable_encoder
 from extensions.ext_redis import redis_client
 
 if TYPE_CHECKING:
+    from redis.commands.core import Script
+
     from models.account import Account
     from models.model import EndUser
 
@@ -199,8 +201,10 @@ def extract_remote_ip(request) -> str:
 
 
 def generate_text_hash(text: str) -> str:
-    hash_text = str(text) + "None"
-    return sha256(hash_text.encode()).hexdigest()
+    # feed the suffix separately instead of concatenating, which would copy the whole text
+    text_hash = sha256(str(text).encode())
+    text_hash.update(b"None")
+    return text_hash.hexdigest()
 
 
 def compact_generate_response(response: Union[Mapping, Generator, RateLimitGenerator]) -> Response:
@@ -346,10 +350,24 @@ class TokenManager:
 
 
 class RateLimiter:
+    # drop expired attempts, check the limit and record the attempt in a single atomic round-trip
+    _CHECK_AND_INCREMENT_SCRIPT = """
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+        local attempts = redis.call('ZCARD', KEYS[1])
+        if attempts > 0 and attempts >= tonumber(ARGV[2]) then
+            return 1
+        end
+        redis.call('ZADD', KEYS[1], ARGV[3], ARGV[3])
+        redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+        return 0
+    """
+
     def __init__(self, prefix: str, max_attempts: int, time_window: int):
         self.prefix = prefix
         self.max_attempts = max_attempts
         self.time_window = time_window
+        # registered on first use, limiters are created before the redis client is initialized
+        self._check_and_increment: Optional[Script] = None
 
     def _get_key(self, email: str) -> str:
         return f"{self.prefix}:{email}"
@@ -372,3 +390,18 @@ class RateLimiter:
 
         redis_client.zadd(key, {current_time: current_time})
         redis_client.expire(key, self.time_window * 2)
+
+    def check_and_increment_rate_limit(self, email: str) -> bool:
+        """
+        Record an attempt unless the limit is already reached.
+
+        :return: True if rate limited, in which case the attempt is not recorded
+        """
+        if self._check_and_increment is None:
+            self._check_and_increment = redis_client.register_script(self._CHECK_AND_INCREMENT_SCRIPT)
+        current_time = int(time.time())
+        rate_limited = self._check_and_increment(
+            keys=[self._get_key(email)],
+            args=[current_time - self.time_window, self.max_attempts, current_time, self.time_window * 2],
+        )
+        return bool(rate_limited)
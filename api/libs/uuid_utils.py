@@ -1,5 +1,7 @@
+import os
 import secrets
 import struct
+import threading
 import time
 import uuid
 
@@ -16,6 +18,11 @@ _PACK_TIMESTAMP = ">Q"
 # into an unsigned 16-bit integer (big-endian).
 _PACK_RAND_A = ">H"
 
+# Number of UUIDv4 values whose random bytes are read from the OS at once by `uuid4_str`.
+_UUID4_BATCH_SIZE = 64
+
+_uuid4_random_pool = threading.local()
+
 
 def _create_uuidv7_bytes(timestamp_ms: int, random_bytes: bytes) -> bytes:
     """Create UUIDv7 byte structure with given timestamp and random bytes.
@@ -162,3 +169,30 @@ def uuidv7_boundary(timestamp_ms: int) -> uuid.UUID:
     uuid_bytes = _create_uuidv7_bytes(timestamp_ms, zero_random_bytes)
 
     return uuid.UUID(bytes=uuid_bytes)
+
+
+def uuid4_str() -> str:
+    """Generate a random UUID version 4 string, equivalent to `str(uuid.uuid4())`.
+
+    Random bytes are read from the OS for `_UUID4_BATCH_SIZE` UUIDs at a time and kept
+    per thread, and the string is formatted directly without building a `uuid.UUID` object.
+    The pool is discarded after a fork so that processes never share random bytes.
+
+    Returns:
+        A UUIDv4 in its canonical 36-character string form.
+    """
+    pool = _uuid4_random_pool
+    if getattr(pool, "pid", None) != os.getpid() or pool.offset >= len(pool.random_bytes):
+        pool.pid = os.getpid()
+        pool.random_bytes = os.urandom(16 * _UUID4_BATCH_SIZE)
+        pool.offset = 0
+
+    uuid_bytes = bytearray(pool.random_bytes[pool.offset : pool.offset + 16])
+    pool.offset += 16
+
+    # Set version to 4 and variant to 10 (binary), as uuid.uuid4() does
+    uuid_bytes[6] = (uuid_bytes[6] & 0x0F) | 0x40
+    uuid_bytes[8] = (uuid_bytes[8] & 0x3F) | 0x80
+
+    hex_ = uuid_bytes.hex()
+    return f"{hex_[:8]}-{hex_[8:12]}-{hex_[12:16]}-{hex_[16:20]}-{hex_[20:]}"
@@ -935,8 +935,12 @@ class Embedding(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.current_timestamp())
     provider_name = mapped_column(String(255), nullable=False, server_default=sa.text("''::character varying"))
 
+    @staticmethod
+    def encode_embedding(embedding_data: list[float]) -> bytes:
+        return pickle.dumps(embedding_data, protocol=pickle.HIGHEST_PROTOCOL)
+
     def set_embedding(self, embedding_data: list[float]):
-        self.embedding = pickle.dumps(embedding_data, protocol=pickle.HIGHEST_PROTOCOL)
+        self.embedding = Embedding.encode_embedding(embedding_data)
 
     def get_embedding(self) -> list[float]:
         return cast(list[float], pickle.loads(self.embedding))  # noqa: S301
@@ -1,7 +1,9 @@
+import threading
 import uuid
 from collections.abc import Generator, Mapping
 from typing import Any, Optional, Union
 
+from cachetools import TTLCache
 from openai._exceptions import RateLimitError
 
 from configs import dify_config
@@ -20,9 +22,24 @@ from services.errors.app import WorkflowIdFormatError, WorkflowNotFoundError
 from services.errors.llm import InvokeRateLimitError
 from services.workflow_service import WorkflowService
 
+_AppGenerator = Union[
+    CompletionAppGenerator, AgentChatAppGenerator, ChatAppGenerator, AdvancedChatAppGenerator, WorkflowAppGenerator
+]
+
 
 class AppGenerateService:
     system_rate_limiter = RateLimiter("app_daily_rate_limiter", dify_config.APP_DAILY_RATE_LIMIT, 86400)
+    # plan changes only need to apply within a few seconds, the billing API is called at most once per TTL
+    _subscription_plan_cache: TTLCache[str, str] = TTLCache(maxsize=10000, ttl=15)
+    _subscription_plan_lock = threading.Lock()
+    # app generator and whether it runs a published or draft workflow, by app mode
+    _APP_GENERATORS: dict[str, tuple[type[_AppGenerator], bool]] = {
+        AppMode.COMPLETION.value: (CompletionAppGenerator, False),
+        AppMode.AGENT_CHAT.value: (AgentChatAppGenerator, False),
+        AppMode.CHAT.value: (ChatAppGenerator, False),
+        AppMode.ADVANCED_CHAT.value: (AdvancedChatAppGenerator, True),
+        AppMode.WORKFLOW.value: (WorkflowAppGenerator, True),
+    }
 
     @classmethod
     def generate(
@@ -45,14 +62,12 @@ class AppGenerateService:
         # system level rate limiter
         if dify_config.BILLING_ENABLED:
             # check if it's free plan
-            limit_info = BillingService.get_info(app_model.tenant_id)
-            if limit_info["subscription"]["plan"] == "sandbox":
-                if cls.system_rate_limiter.is_rate_limited(app_model.tenant_id):
+            if cls._get_subscription_plan(app_model.tenant_id) == "sandbox":
+                if cls.system_rate_limiter.check_and_increment_rate_limit(app_model.tenant_id):
                     raise InvokeRateLimitError(
                         "Rate limit exceeded, please upgrade your plan "
                         f"or your RPD was {dify_config.APP_DAILY_RATE_LIMIT} requests/day"
                     )
-                cls.system_rate_limiter.increment_rate_limit(app_model.tenant_id)
 
         # app level rate limiter
         max_active_request = AppGenerateService._get_max_active_requests(app_model)
@@ -60,69 +75,27 @@ class AppGenerateService:
         request_id = RateLimit.gen_request_key()
         try:
             request_id = rate_limit.enter(request_id)
-            if app_model.mode == AppMode.COMPLETION.value:
-                return rate_limit.generate(
-                    CompletionAppGenerator.convert_to_event_stream(
-                        CompletionAppGenerator().generate(
-                            app_model=app_model, user=user, args=args, invoke_from=invoke_from, streaming=streaming
-                        ),
-                    ),
-                    request_id=request_id,
-                )
-            elif app_model.mode == AppMode.AGENT_CHAT.value or app_model.is_agent:
-                return rate_limit.generate(
-                    AgentChatAppGenerator.convert_to_event_stream(
-                        AgentChatAppGenerator().generate(
-                            app_model=app_model, user=user, args=args, invoke_from=invoke_from, streaming=streaming
-                        ),
-                    ),
-                    request_id,
-                )
-            elif app_model.mode == AppMode.CHAT.value:
-                return rate_limit.generate(
-                    ChatAppGenerator.convert_to_event_stream(
-                        ChatAppGenerator().generate(
-                            app_model=app_model, user=user, args=args, invoke_from=invoke_from, streaming=streaming
-                        ),
-                    ),
-                    request_id=request_id,
-                )
-            elif app_model.mode == AppMode.ADVANCED_CHAT.value:
-                workflow_id = args.get("workflow_id")
-                workflow = cls._get_workflow(app_model, invoke_from, workflow_id)
-                return rate_limit.generate(
-                    AdvancedChatAppGenerator.convert_to_event_stream(
-                        AdvancedChatAppGenerator().generate(
-                            app_model=app_model,
-                            workflow=workflow,
-                            user=user,
-                            args=args,
-                            invoke_from=invoke_from,
-                            streaming=streaming,
-                        ),
-                    ),
-                    request_id=request_id,
-                )
-            elif app_model.mode == AppMode.WORKFLOW.value:
-                workflow_id = args.get("workflow_id")
-                workflow = cls._get_workflow(app_model, invoke_from, workflow_id)
-                return rate_limit.generate(
-                    WorkflowAppGenerator.convert_to_event_stream(
-                        WorkflowAppGenerator().generate(
-                            app_model=app_model,
-                            workflow=workflow,
-                            user=user,
-                            args=args,
-                            invoke_from=invoke_from,
-                            streaming=streaming,
-                            call_depth=0,
-                            workflow_thread_pool_id=None,
-                        ),
-                    ),
-                    request_id,
-                )
-            else:
+            mode = app_model.mode
+            # apps with agent mode enabled are served by the agent chat generator
+            if mode not in {AppMode.COMPLETION.value, AppMode.AGENT_CHAT.value} and app_model.is_agent:
+                mode = AppMode.AGENT_CHAT.value
+            if mode not in cls._APP_GENERATORS:
                 raise ValueError(f"Invalid app mode {app_model.mode}")
+
+            generator_cls, uses_workflow = cls._APP_GENERATORS[mode]
+            generate_kwargs: dict[str, Any] = {
+                "app_model": app_model,
+                "user": user,
+                "args": args,
+                "invoke_from": invoke_from,
+                "streaming": streaming,
+            }
+            if uses_workflow:
+                generate_kwargs["workflow"] = cls._get_workflow(app_model, invoke_from, args.get("workflow_id"))
+            return rate_limit.generate(
+                generator_cls.convert_to_event_stream(generator_cls().generate(**generate_kwargs)),
+                request_id=request_id,
+            )
         except RateLimitError as e:
             raise InvokeRateLimitError(str(e))
         except Exception:
@@ -132,6 +105,22 @@ class AppGenerateService:
             if not streaming:
                 rate_limit.exit(request_id)
 
+    @classmethod
+    def _get_subscription_plan(cls, tenant_id: str) -> str:
+        """
+        Get the subscription plan of a tenant, cached briefly to avoid a billing API call per request.
+
+        :param tenant_id: tenant id
+        :return: subscription plan
+        """
+        with cls._subscription_plan_lock:
+            plan = cls._subscription_plan_cache.get(tenant_id)
+        if plan is None:
+            plan = BillingService.get_info(tenant_id)["subscription"]["plan"]
+            with cls._subscription_plan_lock:
+                cls._subscription_plan_cache[tenant_id] = plan
+        return plan
+
     @staticmethod
     def _get_max_active_requests(app: App) -> int:
         """
@@ -149,9 +138,12 @@ class AppGenerateService:
         app_limit = app.max_active_requests or 0
         config_limit = dify_config.APP_MAX_ACTIVE_REQUESTS
 
-        # Filter out infinite (0) values and return the minimum, or 0 if both are infinite
-        limits = [limit for limit in [app_limit, config_limit] if limit > 0]
-        return min(limits) if limits else 0
+        # Ignore infinite (0) values and return the minimum, or 0 if both are infinite
+        if app_limit <= 0:
+            return max(config_limit, 0)
+        if config_limit <= 0:
+            return app_limit
+        return min(app_limit, config_limit)
 
     @classmethod
     def generate_single_iteration(cls, app_model: App, user: Account, node_id: str, args: Any, streaming: bool = True):
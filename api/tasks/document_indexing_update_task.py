@@ -1,78 +1,190 @@
 import datetime
+import functools
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-import click
 from celery import shared_task  # type: ignore
+from flask import Flask, current_app
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import OperationalError
 
+from configs import dify_config
 from core.indexing_runner import DocumentIsPausedError, IndexingRunner
+from core.rag.index_processor.index_processor_base import BaseIndexProcessor
 from core.rag.index_processor.index_processor_factory import IndexProcessorFactory
+from core.rag.models.document import Document as RagDocument
 from extensions.ext_database import db
+from libs.datetime_utils import naive_utc_now
 from models.dataset import Dataset, Document, DocumentSegment
 
+logger = logging.getLogger(__name__)
 
-@shared_task(queue="dataset")
-def document_indexing_update_task(dataset_id: str, document_id: str):
+# max number of index nodes removed from the vector index per clean call
+CLEAN_BATCH_SIZE = 2000
+# a document whose processing started within this window is assumed to be handled by a duplicate of the task
+DUPLICATE_TASK_WINDOW = datetime.timedelta(minutes=10)
+
+
+@shared_task(queue="dataset", bind=True, max_retries=3)
+def document_indexing_update_task(self, dataset_id: str, document_id: str):
     """
     Async update document
     :param dataset_id:
     :param document_id:
 
     Usage: document_indexing_update_task.delay(dataset_id, document_id)
+
+    The session is removed when the app context of the task is torn down, so it is not closed here.
     """
-    logging.info(click.style(f"Start update document: {document_id}", fg="green"))
+    logger.info("Start update document: %s", document_id)
     start_at = time.perf_counter()
 
-    document = db.session.query(Document).where(Document.id == document_id, Document.dataset_id == dataset_id).first()
-
-    if not document:
-        logging.info(click.style(f"Document not found: {document_id}", fg="red"))
-        db.session.close()
-        return
-
-    document.indexing_status = "parsing"
-    document.processing_started_at = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
-    db.session.commit()
+    # keep the document and dataset loaded across the commits of the cleanup phase instead of reloading them
+    session = db.session()
+    session.expire_on_commit = False
 
-    # delete all document segment and index
+    # mark the document as parsing and load it together with its dataset in one statement.
+    # DocumentService clears processing_started_at before every update it enqueues, so a document whose processing
+    # started recently is left to the duplicate delivery of the task that is already handling it, whichever indexing
+    # status it has reached
+    processing_started_at = naive_utc_now()
     try:
-        dataset = db.session.query(Dataset).where(Dataset.id == dataset_id).first()
-        if not dataset:
-            raise Exception("Dataset not found")
+        row = db.session.execute(
+            update(Document)
+            .where(
+                Document.id == document_id,
+                Document.dataset_id == dataset_id,
+                Dataset.id == Document.dataset_id,
+                or_(
+                    Document.processing_started_at.is_(None),
+                    Document.processing_started_at < processing_started_at - DUPLICATE_TASK_WINDOW,
+                ),
+            )
+            .values(indexing_status="parsing", processing_started_at=processing_started_at)
+            .returning(Document, Dataset)
+        ).first()
+        db.session.commit()
+    except OperationalError as e:
+        # nothing has been claimed yet, so a transient database error is retried instead of dropping the update
+        logger.warning("Claim document failed, document_id: %s, error: %s", document_id, e)
+        db.session.rollback()
+        session.expire_on_commit = True
+        raise self.retry(exc=e, countdown=60 * (2**self.request.retries))
 
-        index_type = document.doc_form
-        index_processor = IndexProcessorFactory(index_type).init_index_processor()
+    if not row:
+        session.expire_on_commit = True
+        probe = db.session.execute(
+            select(Document.id, Dataset.id)
+            .outerjoin(Dataset, Dataset.id == Document.dataset_id)
+            .where(Document.id == document_id, Document.dataset_id == dataset_id)
+        ).first()
+        if not probe:
+            logger.info("Document not found: %s", document_id)
+        elif not probe[1]:
+            # record the failure on the document as the indexing runner does for a missing dataset
+            logger.info("Dataset not found: %s", dataset_id)
+            db.session.execute(
+                update(Document)
+                .where(Document.id == document_id)
+                .values(indexing_status="error", error="no dataset found", stopped_at=naive_utc_now())
+            )
+            db.session.commit()
+        else:
+            logger.info("Document is already being updated: %s", document_id)
+        return
+    document, dataset = row
 
-        segments = db.session.query(DocumentSegment).where(DocumentSegment.document_id == document_id).all()
-        if segments:
-            index_node_ids = [segment.index_node_id for segment in segments]
+    flask_app = current_app._get_current_object()  # type: ignore
+    # extracting the new content of the document does not depend on its previous index, so it overlaps the cleanup
+    with ThreadPoolExecutor(max_workers=1) as extract_executor:
+        extract_future = extract_executor.submit(_extract_document, flask_app=flask_app, document_id=document_id)
 
-            # delete from vector index
-            index_processor.clean(dataset, index_node_ids, with_keywords=True, delete_child_chunks=True)
+        # delete all document segment and index
+        try:
+            index_node_ids = db.session.scalars(
+                select(DocumentSegment.index_node_id).where(DocumentSegment.document_id == document_id)
+            ).all()
+            # documents that were never indexed have nothing to clean
+            if index_node_ids:
+                index_type = document.doc_form
+                index_processor = _get_index_processor(index_type)
 
-            for segment in segments:
-                db.session.delete(segment)
-            db.session.commit()
-        end_at = time.perf_counter()
-        logging.info(
-            click.style(
-                "Cleaned document when document update data source or process rule: {} latency: {}".format(
-                    document_id, end_at - start_at
-                ),
-                fg="green",
+                # delete from vector index in batches to bound the request size for huge documents
+                if len(index_node_ids) <= CLEAN_BATCH_SIZE:
+                    index_processor.clean(dataset, list(index_node_ids), with_keywords=True, delete_child_chunks=True)
+                else:
+                    with ThreadPoolExecutor(max_workers=dify_config.INDEXING_CLEAN_MAX_WORKERS) as executor:
+                        futures = [
+                            executor.submit(
+                                _clean_index_nodes,
+                                flask_app=flask_app,
+                                dataset_id=dataset_id,
+                                index_type=index_type,
+                                index_node_ids=list(index_node_ids[i : i + CLEAN_BATCH_SIZE]),
+                            )
+                            for i in range(0, len(index_node_ids), CLEAN_BATCH_SIZE)
+                        ]
+                        for future in futures:
+                            future.result()
+
+                db.session.query(DocumentSegment).where(DocumentSegment.document_id == document_id).delete(
+                    synchronize_session=False
+                )
+                db.session.commit()
+            end_at = time.perf_counter()
+            logger.info(
+                "Cleaned document when document update data source or process rule: %s latency: %s",
+                document_id,
+                end_at - start_at,
             )
-        )
+        except Exception:
+            logger.exception("Cleaned document when document update data source or process rule failed")
+        finally:
+            session.expire_on_commit = True
+            # the indexing runner reads the latest document state
+            session.expire_all()
+
+    try:
+        extracted_text_docs = {document_id: extract_future.result()}
+    except DocumentIsPausedError:
+        logger.info("Document paused, document id: %s", document_id)
+        return
     except Exception:
-        logging.exception("Cleaned document when document update data source or process rule failed")
+        # the indexing runner extracts the document again and records the failure on it
+        logger.exception("Extract document ahead of indexing failed, document_id: %s", document_id)
+        extracted_text_docs = None
 
     try:
         indexing_runner = IndexingRunner()
-        indexing_runner.run([document])
+        indexing_runner.run([document], extracted_text_docs)
         end_at = time.perf_counter()
-        logging.info(click.style(f"update document: {document.id} latency: {end_at - start_at}", fg="green"))
+        logger.info("update document: %s latency: %s", document_id, end_at - start_at)
     except DocumentIsPausedError as ex:
-        logging.info(click.style(str(ex), fg="yellow"))
+        logger.info("%s", ex)
     except Exception:
-        logging.exception("document_indexing_update_task failed, document_id: %s", document_id)
-    finally:
-        db.session.close()
+        logger.exception("document_indexing_update_task failed, document_id: %s", document_id)
+
+
+@functools.lru_cache(maxsize=8)
+def _get_index_processor(index_type: str) -> BaseIndexProcessor:
+    # index processors are stateless, so one instance per doc form is shared by all tasks of the worker
+    return IndexProcessorFactory(index_type).init_index_processor()
+
+
+def _extract_document(flask_app: Flask, document_id: str) -> list[RagDocument]:
+    with flask_app.app_context():
+        document = db.session.query(Document).where(Document.id == document_id).first()
+        if not document:
+            raise Exception("Document not found")
+
+        return IndexingRunner().extract(document)
+
+
+def _clean_index_nodes(flask_app: Flask, dataset_id: str, index_type: str, index_node_ids: list[str]):
+    with flask_app.app_context():
+        dataset = db.session.query(Dataset).where(Dataset.id == dataset_id).first()
+        if not dataset:
+            raise Exception("Dataset not found")
+
+        _get_index_processor(index_type).clean(dataset, index_node_ids, with_keywords=True, delete_child_chunks=True)
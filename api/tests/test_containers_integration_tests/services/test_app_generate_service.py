@@ -50,6 +50,7 @@ class TestAppGenerateService:
             mock_rate_limiter_instance = mock_rate_limiter.return_value
             mock_rate_limiter_instance.is_rate_limited.return_value = False
             mock_rate_limiter_instance.increment_rate_limit.return_value = None
+            mock_rate_limiter_instance.check_and_increment_rate_limit.return_value = False
 
             # Setup default mock returns for app generators
             mock_completion_generator_instance = mock_completion_generator.return_value
@@ -470,7 +471,7 @@ class TestAppGenerateService:
 
         # Setup system rate limiter to return rate limited
         with patch("services.app_generate_service.AppGenerateService.system_rate_limiter") as mock_system_rate_limiter:
-            mock_system_rate_limiter.is_rate_limited.return_value = True
+            mock_system_rate_limiter.check_and_increment_rate_limit.return_value = True
 
             # Setup test arguments
             args = {"inputs": {"query": fake.text(max_nb_chars=50)}, "response_mode": "streaming"}
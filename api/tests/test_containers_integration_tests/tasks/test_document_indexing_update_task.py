@@ -0,0 +1,170 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from faker import Faker
+
+from extensions.ext_database import db
+from libs.datetime_utils import naive_utc_now
+from models.dataset import Dataset, Document
+from tasks.document_indexing_update_task import DUPLICATE_TASK_WINDOW, document_indexing_update_task
+
+
+class TestDocumentIndexingUpdateTask:
+    """Integration tests for claiming a document in document_indexing_update_task using testcontainers."""
+
+    @pytest.fixture
+    def mock_external_service_dependencies(self):
+        """Mock setup for the extraction and indexing that follow the claim."""
+        with (
+            patch("tasks.document_indexing_update_task.IndexingRunner") as mock_indexing_runner,
+            patch("tasks.document_indexing_update_task._extract_document") as mock_extract_document,
+        ):
+            mock_extract_document.return_value = []
+
+            yield {
+                "indexing_runner": mock_indexing_runner,
+                "extract_document": mock_extract_document,
+            }
+
+    def _create_test_dataset(self, db_session_with_containers):
+        """
+        Helper method to create a test dataset for testing.
+
+        Args:
+            db_session_with_containers: Database session from testcontainers infrastructure
+
+        Returns:
+            Dataset: Created dataset instance
+        """
+        fake = Faker()
+
+        dataset = Dataset(
+            tenant_id=fake.uuid4(),
+            name=fake.company(),
+            data_source_type="upload_file",
+            indexing_technique="high_quality",
+            created_by=fake.uuid4(),
+        )
+        db.session.add(dataset)
+        db.session.commit()
+
+        return dataset
+
+    def _create_test_document(self, db_session_with_containers, dataset_id, tenant_id, processing_started_at=None):
+        """
+        Helper method to create a test document for testing.
+
+        Args:
+            db_session_with_containers: Database session from testcontainers infrastructure
+            dataset_id: ID of the dataset the document belongs to
+            tenant_id: ID of the tenant the document belongs to
+            processing_started_at: Start time of a previous processing of the document
+
+        Returns:
+            Document: Created document instance
+        """
+        fake = Faker()
+
+        document = Document(
+            tenant_id=tenant_id,
+            dataset_id=dataset_id,
+            position=1,
+            data_source_type="upload_file",
+            batch=fake.uuid4(),
+            name=fake.file_name(),
+            created_from="web",
+            created_by=fake.uuid4(),
+            indexing_status="waiting",
+            processing_started_at=processing_started_at,
+        )
+        db.session.add(document)
+        db.session.commit()
+
+        return document
+
+    def test_claims_document(self, db_session_with_containers, mock_external_service_dependencies):
+        """
+        Test that the first delivery of the task claims the document and hands it to the indexing runner
+        together with its dataset.
+        """
+        dataset = self._create_test_dataset(db_session_with_containers)
+        document = self._create_test_document(db_session_with_containers, dataset.id, dataset.tenant_id)
+        dataset_id, document_id = dataset.id, document.id
+
+        document_indexing_update_task.run(dataset_id, document_id)
+
+        db.session.expire_all()
+        document = db.session.get(Document, document_id)
+        assert document.indexing_status == "parsing"
+        assert document.processing_started_at is not None
+
+        mock_run = mock_external_service_dependencies["indexing_runner"].return_value.run
+        mock_run.assert_called_once()
+        (claimed_document,), _ = mock_run.call_args.args
+        assert claimed_document.id == document_id
+        assert claimed_document.dataset.id == dataset_id
+
+    def test_skips_document_claimed_by_duplicate_task(
+        self, db_session_with_containers, mock_external_service_dependencies
+    ):
+        """
+        Test that a document whose processing started within DUPLICATE_TASK_WINDOW is left to the task
+        that is already handling it.
+        """
+        processing_started_at = naive_utc_now() - DUPLICATE_TASK_WINDOW / 2
+        dataset = self._create_test_dataset(db_session_with_containers)
+        document = self._create_test_document(
+            db_session_with_containers, dataset.id, dataset.tenant_id, processing_started_at=processing_started_at
+        )
+        dataset_id, document_id = dataset.id, document.id
+
+        document_indexing_update_task.run(dataset_id, document_id)
+
+        db.session.expire_all()
+        document = db.session.get(Document, document_id)
+        assert document.indexing_status == "waiting"
+        assert document.processing_started_at == processing_started_at
+        mock_external_service_dependencies["indexing_runner"].assert_not_called()
+        mock_external_service_dependencies["extract_document"].assert_not_called()
+
+    def test_reclaims_document_after_duplicate_task_window(
+        self, db_session_with_containers, mock_external_service_dependencies
+    ):
+        """
+        Test that a document whose processing started before DUPLICATE_TASK_WINDOW is claimed again.
+        """
+        processing_started_at = naive_utc_now() - DUPLICATE_TASK_WINDOW - timedelta(minutes=1)
+        dataset = self._create_test_dataset(db_session_with_containers)
+        document = self._create_test_document(
+            db_session_with_containers, dataset.id, dataset.tenant_id, processing_started_at=processing_started_at
+        )
+        dataset_id, document_id = dataset.id, document.id
+
+        document_indexing_update_task.run(dataset_id, document_id)
+
+        db.session.expire_all()
+        document = db.session.get(Document, document_id)
+        assert document.indexing_status == "parsing"
+        assert document.processing_started_at > processing_started_at
+        mock_external_service_dependencies["indexing_runner"].return_value.run.assert_called_once()
+
+    def test_records_error_when_dataset_not_found(self, db_session_with_containers, mock_external_service_dependencies):
+        """
+        Test that a document whose dataset no longer exists is not claimed and has the failure recorded on it.
+        """
+        fake = Faker()
+        dataset_id = fake.uuid4()
+        document = self._create_test_document(db_session_with_containers, dataset_id, fake.uuid4())
+        document_id = document.id
+
+        document_indexing_update_task.run(dataset_id, document_id)
+
+        db.session.expire_all()
+        document = db.session.get(Document, document_id)
+        assert document.indexing_status == "error"
+        assert document.error == "no dataset found"
+        assert document.stopped_at is not None
+        assert document.processing_started_at is None
+        mock_external_service_dependencies["indexing_runner"].assert_not_called()
+        mock_external_service_dependencies["extract_document"].assert_not_called()
@@ -1,6 +1,9 @@
+import json
+
 from core.app.app_config.features.file_upload.manager import FileUploadConfigManager
 from core.file.models import FileTransferMethod, FileUploadConfig, ImageConfig
 from core.model_runtime.entities.message_entities import ImagePromptMessageContent
+from models.model import AppModelConfig
 
 
 def test_convert_with_vision():
@@ -63,3 +66,22 @@ def test_validate_and_set_defaults_with_existing_config():
     assert result["file_upload"]["enabled"] is True
     assert result["file_upload"]["number_limits"] == 5
     assert result["file_upload"]["allowed_file_upload_methods"] == [FileTransferMethod.REMOTE_URL]
+
+
+def test_convert_app_model_config():
+    file_upload = {
+        "enabled": True,
+        "number_limits": 5,
+        "allowed_file_upload_methods": [FileTransferMethod.REMOTE_URL],
+        "image": {"detail": "high"},
+    }
+    app_model_config = AppModelConfig(file_upload=json.dumps(file_upload))
+    result = FileUploadConfigManager.convert_app_model_config(app_model_config)
+    assert result == FileUploadConfigManager.convert({"file_upload": file_upload})
+    assert FileUploadConfigManager.convert_app_model_config(app_model_config) is result
+
+
+def test_convert_app_model_config_without_file_upload():
+    assert FileUploadConfigManager.convert_app_model_config(AppModelConfig()) is None
+    disabled = AppModelConfig(file_upload=json.dumps({"enabled": False}))
+    assert FileUploadConfigManager.convert_app_model_config(disabled) is None
@@ -0,0 +1,32 @@
+import threading
+from concurrent.futures import Future
+from unittest.mock import patch
+
+from core.app.apps.agent_chat import app_generator
+
+
+def test_generate_worker_done_releases_slot():
+    future: Future[None] = Future()
+    future.set_result(None)
+
+    with patch.object(app_generator, "_generate_worker_slots", new=threading.BoundedSemaphore(1)) as slots:
+        slots.acquire()
+        app_generator._on_generate_worker_done(future)
+
+        assert slots.acquire(blocking=False)
+
+
+def test_generate_worker_done_logs_uncaught_exception():
+    future: Future[None] = Future()
+    error = RuntimeError("worker crashed")
+    future.set_exception(error)
+
+    with (
+        patch.object(app_generator, "_generate_worker_slots", new=threading.BoundedSemaphore(1)) as slots,
+        patch.object(app_generator, "logger") as mock_logger,
+    ):
+        slots.acquire()
+        app_generator._on_generate_worker_done(future)
+
+        assert slots.acquire(blocking=False)
+        mock_logger.error.assert_called_once_with("Agent chat generate worker failed", exc_info=error)
@@ -0,0 +1,97 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core.app.apps import base_app_queue_manager
+from core.app.apps.base_app_queue_manager import AppQueueManager
+from core.app.apps.message_based_app_queue_manager import MessageBasedAppQueueManager
+from core.app.entities.app_invoke_entities import InvokeFrom
+from core.app.entities.queue_entities import QueueStopEvent
+
+
+@pytest.fixture
+def mock_redis():
+    redis = MagicMock()
+    redis.get.return_value = None
+    with patch.object(base_app_queue_manager, "redis_client", new=redis):
+        yield redis
+
+
+@pytest.fixture
+def queue_manager(mock_redis, monkeypatch):
+    monkeypatch.setattr(base_app_queue_manager.dify_config, "APP_MAX_EXECUTION_TIME", 30)
+    monkeypatch.setattr(AppQueueManager, "_STOP_FLAG_CHECK_INTERVAL", 0.1)
+    stop_signal_listener = MagicMock()
+    # the stop flag is polled as a fallback while the stop signal listener is down
+    stop_signal_listener.is_alive.return_value = False
+    with patch.object(base_app_queue_manager, "_stop_signal_listener", new=stop_signal_listener):
+        yield MessageBasedAppQueueManager(
+            task_id="task-id",
+            user_id="user-id",
+            invoke_from=InvokeFrom.SERVICE_API,
+            conversation_id="conversation-id",
+            app_mode="chat",
+            message_id="message-id",
+        )
+
+
+def _listen_until_stopped(queue_manager: AppQueueManager) -> tuple[list, float]:
+    start = time.monotonic()
+    events = [message.event for message in queue_manager.listen()]
+    return events, time.monotonic() - start
+
+
+def test_listen_stops_when_stop_flag_is_set_without_listener(queue_manager):
+    threading.Timer(0.2, setattr, args=(queue_manager, "_stopped", True)).start()
+
+    events, elapsed = _listen_until_stopped(queue_manager)
+
+    assert isinstance(events[-1], QueueStopEvent)
+    assert elapsed < 2
+
+
+def test_listen_stops_when_stop_flag_is_set_in_redis_without_listener(queue_manager, mock_redis):
+    threading.Timer(0.2, setattr, args=(mock_redis.get, "return_value", b"1")).start()
+
+    events, elapsed = _listen_until_stopped(queue_manager)
+
+    assert isinstance(events[-1], QueueStopEvent)
+    assert elapsed < 2
+
+
+def test_stop_signal_wakes_up_listen(queue_manager, mock_redis, monkeypatch):
+    # the stop flag is never polled, only the stop signal can end listening in time
+    monkeypatch.setattr(AppQueueManager, "_STOP_FLAG_CHECK_INTERVAL", 60)
+    channel = AppQueueManager._generate_stopped_cache_key(queue_manager._task_id).encode()
+
+    def pubsub_messages():
+        time.sleep(0.2)
+        yield {"type": "pmessage", "channel": channel, "data": b"1"}
+
+    mock_redis.pubsub.return_value.listen.return_value = pubsub_messages()
+    listener = base_app_queue_manager._StopSignalListener()
+    listener._queue_managers[queue_manager._task_id] = queue_manager
+    threading.Thread(target=listener._listen, daemon=True).start()
+
+    events, elapsed = _listen_until_stopped(queue_manager)
+
+    assert queue_manager._stopped
+    assert [type(event) for event in events] == [QueueStopEvent]
+    assert elapsed < 2
+
+
+def test_listen_does_not_poll_stop_flag_while_listener_is_alive(queue_manager, mock_redis):
+    base_app_queue_manager._stop_signal_listener.is_alive.return_value = True
+    consumer = threading.Thread(target=_listen_until_stopped, args=(queue_manager,), daemon=True)
+    consumer.start()
+
+    # an idle stream only wakes up for the next ping
+    time.sleep(0.5)
+    assert consumer.is_alive()
+    mock_redis.get.assert_not_called()
+
+    queue_manager.stop_listen()
+    consumer.join(timeout=2)
+    assert not consumer.is_alive()
@@ -0,0 +1,32 @@
+import pytest
+
+from core.app.entities.queue_entities import QueueAgentLogEvent, QueueErrorEvent, QueueLLMChunkEvent
+from models.model import Message
+
+
+def test_untyped_fields_are_resolved_per_event_class():
+    assert QueueLLMChunkEvent._untyped_fields == ()
+    assert QueueErrorEvent._untyped_fields == ("error",)
+
+
+def test_should_allow_plain_values_in_untyped_fields():
+    error = ValueError("test")
+
+    assert QueueErrorEvent(error=error).error is error
+
+
+def test_should_reject_sqlalchemy_models_at_construction():
+    with pytest.raises(TypeError, match="SQLAlchemy Model"):
+        QueueErrorEvent(error={"messages": [Message()]})
+
+    with pytest.raises(TypeError, match="SQLAlchemy Model"):
+        QueueAgentLogEvent(
+            id="log_id",
+            label="label",
+            node_execution_id="node_execution_id",
+            parent_id=None,
+            error=None,
+            status="success",
+            data={"message": Message()},
+            node_id="node_id",
+        )
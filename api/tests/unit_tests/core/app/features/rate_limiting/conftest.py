@@ -1,4 +1,5 @@
 import time
+from collections import defaultdict
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -122,3 +123,11 @@ def redis_patch():
     """Patch redis_client globally for rate limit tests."""
     with patch("core.app.features.rate_limiting.rate_limit.redis_client") as mock:
         yield mock
+
+
+@pytest.fixture
+def redis_scripts(redis_patch):
+    """Give every registered Lua script its own mock, keyed by script source."""
+    scripts: defaultdict[str, MagicMock] = defaultdict(MagicMock)
+    redis_patch.register_script.side_effect = lambda script: scripts[script]
+    return scripts
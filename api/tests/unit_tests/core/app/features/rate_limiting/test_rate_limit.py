@@ -4,6 +4,7 @@ from datetime import timedelta
 from unittest.mock import patch
 
 import pytest
+from cachetools import LRUCache
 
 from core.app.features.rate_limiting.rate_limit import RateLimit
 from core.errors.error import AppInvokeQuotaExceededError
@@ -45,6 +46,25 @@ class TestRateLimit:
         assert rate_limit1.client_id == "client1"
         assert rate_limit2.client_id == "client2"
 
+    def test_should_evict_least_recently_used_instances(self, redis_patch):
+        """Test instance registry stays bounded for many client IDs."""
+        redis_patch.configure_mock(
+            **{
+                "exists.return_value": False,
+                "setex.return_value": True,
+            }
+        )
+
+        with patch.object(RateLimit, "_instance_dict", LRUCache(maxsize=2)):
+            rate_limit1 = RateLimit("client1", 5)
+            RateLimit("client2", 5)
+            assert RateLimit("client1", 5) is rate_limit1  # client1 becomes most recently used
+            RateLimit("client3", 5)
+
+            assert len(RateLimit._instance_dict) == 2
+            assert "client1" in RateLimit._instance_dict
+            assert "client2" not in RateLimit._instance_dict
+
     def test_should_initialize_with_valid_parameters(self, redis_patch):
         """Test normal initialization."""
         redis_patch.configure_mock(
@@ -106,101 +126,122 @@ class TestRateLimit:
         expected_max_key = "dify:rate_limit:test_client:max_active_requests"
         redis_patch.setex.assert_called_with(expected_max_key, timedelta(days=1), 5)
 
-    def test_should_sync_max_requests_from_redis_on_subsequent_flush(self, redis_patch):
-        """Test max requests syncs from Redis when key exists."""
+    @patch("time.time")
+    def test_should_sync_max_requests_from_redis_on_subsequent_flush(self, mock_time, redis_patch):
+        """Test max requests syncs from Redis once the sync interval has passed."""
+        mock_time.return_value = 1000.0
         redis_patch.configure_mock(
             **{
-                "exists.return_value": True,
                 "get.return_value": b"10",
                 "expire.return_value": True,
             }
         )
 
         rate_limit = RateLimit("test_client", 5)
+        mock_time.return_value = 1000.0 + RateLimit._MAX_ACTIVE_REQUESTS_SYNC_INTERVAL + 1
         rate_limit.flush_cache()
 
         assert rate_limit.max_active_requests == 10
+        redis_patch.expire.assert_called_once()
+
+    @patch("time.time")
+    def test_should_reuse_local_max_requests_within_sync_interval(self, mock_time, redis_patch):
+        """Test max requests is not re-read from Redis on every flush."""
+        mock_time.return_value = 1000.0
+        redis_patch.configure_mock(
+            **{
+                "get.return_value": b"10",
+            }
+        )
+
+        rate_limit = RateLimit("test_client", 5)
+        redis_patch.reset_mock()
+        mock_time.return_value = 1000.0 + RateLimit._ACTIVE_REQUESTS_COUNT_FLUSH_INTERVAL + 1
+        rate_limit.flush_cache()
+
+        assert rate_limit.max_active_requests == 5
+        redis_patch.get.assert_not_called()
+        redis_patch.expire.assert_not_called()
 
     @patch("time.time")
-    def test_should_clean_timeout_requests_from_active_list(self, mock_time, redis_patch):
-        """Test cleanup of timed-out requests."""
+    def test_should_clean_timeout_requests_from_active_list(self, mock_time, redis_patch, redis_scripts):
+        """Test cleanup of timed-out requests is delegated to the flush script."""
         current_time = 1000.0
         mock_time.return_value = current_time
 
-        # Setup mock Redis with timed-out requests
-        timeout_requests = {
-            b"req1": str(current_time - 700).encode(),  # 700 seconds ago (timeout)
-            b"req2": str(current_time - 100).encode(),  # 100 seconds ago (active)
-        }
-
         redis_patch.configure_mock(
             **{
                 "exists.return_value": True,
                 "get.return_value": b"5",
                 "expire.return_value": True,
-                "hgetall.return_value": timeout_requests,
-                "hdel.return_value": 1,
             }
         )
 
         rate_limit = RateLimit("test_client", 5)
-        redis_patch.reset_mock()  # Reset to avoid counting initialization calls
+        flush_script = redis_scripts[RateLimit._FLUSH_ACTIVE_REQUESTS_SCRIPT]
+        flush_script.reset_mock()  # Reset to avoid counting initialization calls
         rate_limit.flush_cache()
 
-        # Verify timeout request was cleaned up
-        redis_patch.hdel.assert_called_once()
-        call_args = redis_patch.hdel.call_args[0]
-        assert call_args[0] == "dify:rate_limit:test_client:active_requests"
-        assert b"req1" in call_args  # Timeout request should be removed
-        assert b"req2" not in call_args  # Active request should remain
+        # Verify timeout requests are removed server-side in one call
+        flush_script.assert_called_once_with(
+            keys=["dify:rate_limit:test_client:active_requests"],
+            args=[current_time, RateLimit._REQUEST_MAX_ALIVE_TIME, 86400],
+        )
+        redis_patch.hgetall.assert_not_called()
+        redis_patch.hdel.assert_not_called()
 
 
 class TestRateLimitEnterExit:
     """Rate limiting enter/exit logic tests."""
 
-    def test_should_allow_request_within_limit(self, redis_patch):
+    @patch("time.time")
+    def test_should_allow_request_within_limit(self, mock_time, redis_patch, redis_scripts):
         """Test allowing requests within the rate limit."""
+        mock_time.return_value = 1000.0
         redis_patch.configure_mock(
             **{
                 "exists.return_value": False,
                 "setex.return_value": True,
-                "hlen.return_value": 2,
-                "hset.return_value": True,
             }
         )
+        enter_script = redis_scripts[RateLimit._ENTER_SCRIPT]
+        enter_script.return_value = 1
 
         rate_limit = RateLimit("test_client", 5)
         request_id = rate_limit.enter()
 
         assert request_id != RateLimit._UNLIMITED_REQUEST_ID
-        redis_patch.hset.assert_called_once()
+        enter_script.assert_called_once_with(
+            keys=["dify:rate_limit:test_client:active_requests"],
+            args=[5, request_id, "1000.0"],
+        )
+        redis_patch.hlen.assert_not_called()
+        redis_patch.hset.assert_not_called()
 
-    def test_should_generate_request_id_if_not_provided(self, redis_patch):
+    def test_should_generate_request_id_if_not_provided(self, redis_patch, redis_scripts):
         """Test auto-generation of request ID."""
         redis_patch.configure_mock(
             **{
                 "exists.return_value": False,
                 "setex.return_value": True,
-                "hlen.return_value": 0,
-                "hset.return_value": True,
             }
         )
+        redis_scripts[RateLimit._ENTER_SCRIPT].return_value = 1
 
         rate_limit = RateLimit("test_client", 5)
         request_id = rate_limit.enter()
 
         assert len(request_id) == 36  # UUID format
 
-    def test_should_use_provided_request_id(self, redis_patch):
+    def test_should_use_provided_request_id(self, redis_patch, redis_scripts):
         """Test using provided request ID."""
         redis_patch.configure_mock(
             **{
                 "exists.return_value": False,
                 "setex.return_value": True,
-                "hlen.return_value": 0,
-                "hset.return_value": True,
             }
         )
+        redis_scripts[RateLimit._ENTER_SCRIPT].return_value = 1
 
         rate_limit = RateLimit("test_client", 5)
         custom_id = "custom_request_123"
@@ -221,15 +262,15 @@ class TestRateLimitEnterExit:
 
         redis_patch.hdel.assert_called_once_with("dify:rate_limit:test_client:active_requests", "test_request_id")
 
-    def test_should_raise_quota_exceeded_when_at_limit(self, redis_patch):
+    def test_should_raise_quota_exceeded_when_at_limit(self, redis_patch, redis_scripts):
         """Test quota exceeded error when at limit."""
         redis_patch.configure_mock(
             **{
                 "exists.return_value": False,
                 "setex.return_value": True,
-                "hlen.return_value": 5,  # At limit
             }
         )
+        redis_scripts[RateLimit._ENTER_SCRIPT].return_value = 0  # At limit
 
         rate_limit = RateLimit("test_client", 5)
 
@@ -239,17 +280,16 @@ class TestRateLimitEnterExit:
         assert "Too many requests" in str(exc_info.value)
         assert "test_client" in str(exc_info.value)
 
-    def test_should_allow_request_after_previous_exit(self, redis_patch):
+    def test_should_allow_request_after_previous_exit(self, redis_patch, redis_scripts):
         """Test allowing new request after previous exit."""
         redis_patch.configure_mock(
             **{
                 "exists.return_value": False,
                 "setex.return_value": True,
-                "hlen.return_value": 4,  # Under limit after exit
-                "hset.return_value": True,
                 "hdel.return_value": 1,
             }
         )
+        redis_scripts[RateLimit._ENTER_SCRIPT].return_value = 1  # Under limit after exit
 
         rate_limit = RateLimit("test_client", 5)
 
@@ -260,15 +300,15 @@ class TestRateLimitEnterExit:
         assert new_request_id is not None
 
     @patch("time.time")
-    def test_should_flush_cache_when_interval_exceeded(self, mock_time, redis_patch):
+    def test_should_flush_cache_when_interval_exceeded(self, mock_time, redis_patch, redis_scripts):
         """Test cache flush when time interval exceeded."""
         redis_patch.configure_mock(
             **{
                 "exists.return_value": False,
                 "setex.return_value": True,
-                "hlen.return_value": 0,
             }
         )
+        redis_scripts[RateLimit._ENTER_SCRIPT].return_value = 1
 
         mock_time.return_value = 1000.0
         rate_limit = RateLimit("test_client", 5)
@@ -277,10 +317,12 @@ class TestRateLimitEnterExit:
         mock_time.return_value = 1400.0  # 400 seconds later
         redis_patch.reset_mock()
 
+        redis_scripts[RateLimit._FLUSH_ACTIVE_REQUESTS_SCRIPT].reset_mock()
+
         rate_limit.enter()
 
-        # Should have called setex again due to cache flush
-        redis_patch.setex.assert_called()
+        # Should have swept the in-transit request list again due to cache flush
+        redis_scripts[RateLimit._FLUSH_ACTIVE_REQUESTS_SCRIPT].assert_called_once()
 
     def test_should_return_unlimited_id_when_disabled(self):
         """Test unlimited ID return when rate limiting disabled."""
@@ -453,28 +495,27 @@ class TestRateLimitConcurrency:
         assert len(errors) == 0
         assert len({id(inst) for inst in instances}) == 1  # All same instance
 
-    def test_should_handle_concurrent_enter_requests(self, redis_patch):
+    def test_should_handle_concurrent_enter_requests(self, redis_patch, redis_scripts):
         """Test concurrent enter requests handling."""
-        # Setup mock to simulate realistic Redis behavior
+        # Setup mock to simulate the atomic check-and-set of the enter script
+        lock = threading.Lock()
         request_count = 0
 
-        def mock_hlen(key):
+        def mock_enter(keys, args):
             nonlocal request_count
-            return request_count
-
-        def mock_hset(key, field, value):
-            nonlocal request_count
-            request_count += 1
-            return True
+            with lock:
+                if request_count >= int(args[0]):
+                    return 0
+                request_count += 1
+                return 1
 
         redis_patch.configure_mock(
             **{
                 "exists.return_value": False,
                 "setex.return_value": True,
-                "hlen.side_effect": mock_hlen,
-                "hset.side_effect": mock_hset,
             }
         )
+        redis_scripts[RateLimit._ENTER_SCRIPT].side_effect = mock_enter
 
         rate_limit = RateLimit("concurrent_client", 3)
         results = []
@@ -496,15 +537,17 @@ class TestRateLimitConcurrency:
 
         # Should have some successful requests and some quota exceeded
         assert len(results) + len(errors) == 5
-        assert len(errors) > 0  # Some should be rejected
+        assert len(results) == 3  # Never admits more than the limit
+        assert len(errors) == 2
 
     @patch("time.time")
-    def test_should_maintain_accurate_count_under_load(self, mock_time, redis_patch):
+    def test_should_maintain_accurate_count_under_load(self, mock_time, redis_patch, redis_scripts):
         """Test accurate count maintenance under concurrent load."""
         mock_time.return_value = 1000.0
 
         # Use real mock_redis fixture for better simulation
         mock_client = self._create_mock_redis()
+        redis_scripts[RateLimit._ENTER_SCRIPT].side_effect = mock_client.pop("enter_script.side_effect")
         redis_patch.configure_mock(**mock_client)
 
         rate_limit = RateLimit("load_test_client", 10)
@@ -538,16 +581,13 @@ class TestRateLimitConcurrency:
         data = {}
         hashes = {}
 
-        def mock_hlen(key):
-            with lock:
-                return len(hashes.get(key, {}))
-
-        def mock_hset(key, field, value):
+        def mock_enter(keys, args):
             with lock:
-                if key not in hashes:
-                    hashes[key] = {}
-                hashes[key][field] = str(value).encode("utf-8")
-                return True
+                requests = hashes.setdefault(keys[0], {})
+                if len(requests) >= int(args[0]):
+                    return 0
+                requests[args[1]] = str(args[2]).encode("utf-8")
+                return 1
 
         def mock_hdel(key, *fields):
             with lock:
@@ -563,7 +603,6 @@ class TestRateLimitConcurrency:
         return {
             "exists.return_value": False,
             "setex.return_value": True,
-            "hlen.side_effect": mock_hlen,
-            "hset.side_effect": mock_hset,
+            "enter_script.side_effect": mock_enter,
             "hdel.side_effect": mock_hdel,
         }
@@ -0,0 +1,87 @@
+import pytest
+
+from core.rag.cleaner.clean_processor import CleanProcessor
+
+
+def _rules(*rule_ids: str) -> dict:
+    return {"rules": {"pre_processing_rules": [{"id": rule_id, "enabled": True} for rule_id in rule_ids]}}
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("<|im_start|>user<|im_end|>", "<im_start>user<im_end>"),
+        ("a\x00b\x08c\x0bd\x0ce\x0ef\x1fg\x7fh", "abcdefgh"),
+        # tab, newline and carriage return are kept
+        ("a\tb\nc\rd", "a\tb\nc\rd"),
+        ("a\ufffeb", "ab"),
+        # the historical byte-like characters of the UTF-8 encoding of U+FFFE are removed as well
+        ("caf\xef\xbf\xbe", "caf"),
+    ],
+)
+def test_default_clean(text, expected):
+    assert CleanProcessor.clean(text, {}) == expected
+
+
+def test_default_clean_without_process_rule():
+    assert CleanProcessor.clean("a<|b|>\x00", None) == "a<b>"
+
+
+def test_remove_extra_spaces():
+    text = "line1\n\n\n\nline2\n\nline3  with \t spaces\u3000\u3000and  more"
+
+    result = CleanProcessor.clean(text, _rules("remove_extra_spaces"))
+
+    assert result == "line1\n\nline2\n\nline3 with spaces and more"
+
+
+def test_remove_extra_spaces_keeps_single_spaces_and_double_newlines():
+    text = "a b\n\nc"
+
+    assert CleanProcessor.clean(text, _rules("remove_extra_spaces")) == text
+
+
+def test_remove_urls_emails_removes_bare_url():
+    text = "see https://example.com/path?q=1 and http://foo.bar for details"
+
+    result = CleanProcessor.clean(text, _rules("remove_urls_emails"))
+
+    assert result == "see  and  for details"
+
+
+def test_remove_urls_emails_removes_email():
+    text = "contact john.doe+tag@example.co.uk today"
+
+    result = CleanProcessor.clean(text, _rules("remove_urls_emails"))
+
+    assert result == "contact  today"
+
+
+def test_remove_urls_emails_keeps_markdown_image():
+    text = "before ![alt text](https://example.com/image.png) after https://example.com/page"
+
+    result = CleanProcessor.clean(text, _rules("remove_urls_emails"))
+
+    assert result == "before ![image](https://example.com/image.png) after "
+
+
+def test_remove_urls_emails_stops_url_at_unicode_space():
+    text = "详见 https://example.com/doc\u3000中文内容 更多"
+
+    result = CleanProcessor.clean(text, _rules("remove_urls_emails"))
+
+    assert result == "详见 \u3000中文内容 更多"
+
+
+def test_disabled_rules_are_skipped():
+    text = "a   b https://example.com"
+    process_rule = {
+        "rules": {
+            "pre_processing_rules": [
+                {"id": "remove_extra_spaces", "enabled": False},
+                {"id": "remove_urls_emails", "enabled": False},
+            ]
+        }
+    }
+
+    assert CleanProcessor.clean(text, process_rule) == text
@@ -0,0 +1,110 @@
+import math
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from core.model_runtime.entities.model_entities import ModelPropertyKey
+from core.rag.embedding.cached_embedding import CacheEmbedding
+from libs.helper import generate_text_hash
+from models.dataset import Embedding
+
+
+def _model_instance(max_chunks: int = 10) -> MagicMock:
+    model_instance = MagicMock()
+    model_instance.model = "text-embedding"
+    model_instance.provider = "openai"
+    model_schema = model_instance.model_type_instance.get_model_schema.return_value
+    model_schema.model_properties = {ModelPropertyKey.MAX_CHUNKS: max_chunks}
+    return model_instance
+
+
+def _embedding_result(*embeddings: list[float]) -> MagicMock:
+    result = MagicMock()
+    result.embeddings = list(embeddings)
+    return result
+
+
+def _cached(text: str, embedding: list[float]) -> Embedding:
+    cached = Embedding(model_name="text-embedding", hash=generate_text_hash(text), provider_name="openai")
+    cached.set_embedding(embedding)
+    return cached
+
+
+@pytest.fixture
+def mock_db():
+    with patch("core.rag.embedding.cached_embedding.db") as mock_db:
+        mock_db.session.query.return_value.filter.return_value = []
+        yield mock_db
+
+
+def _inserted_rows(mock_db) -> list[dict]:
+    mock_db.session.execute.assert_called_once()
+    stmt, rows = mock_db.session.execute.call_args.args
+    assert "ON CONFLICT (model_name, hash, provider_name) DO NOTHING" in str(stmt.compile(dialect=postgresql.dialect()))
+    return rows
+
+
+def test_embed_documents_mixes_cached_and_uncached(mock_db):
+    mock_db.session.query.return_value.filter.return_value = [_cached("cached", [0.6, 0.8])]
+    model_instance = _model_instance()
+    model_instance.invoke_text_embedding.return_value = _embedding_result([3.0, 4.0])
+
+    result = CacheEmbedding(model_instance).embed_documents(["cached", "new"])
+
+    assert result == [[0.6, 0.8], pytest.approx([0.6, 0.8])]
+    assert model_instance.invoke_text_embedding.call_args.kwargs["texts"] == ["new"]
+    rows = _inserted_rows(mock_db)
+    assert [row["hash"] for row in rows] == [generate_text_hash("new")]
+    assert Embedding(embedding=rows[0]["embedding"]).get_embedding() == pytest.approx([0.6, 0.8])
+    mock_db.session.commit.assert_called_once()
+
+
+def test_embed_documents_embeds_repeated_texts_once(mock_db):
+    model_instance = _model_instance()
+    model_instance.invoke_text_embedding.return_value = _embedding_result([1.0, 0.0], [0.0, 2.0])
+
+    result = CacheEmbedding(model_instance).embed_documents(["a", "b", "a", "a"])
+
+    assert model_instance.invoke_text_embedding.call_args.kwargs["texts"] == ["a", "b"]
+    assert result == [[1.0, 0.0], [0.0, 1.0], [1.0, 0.0], [1.0, 0.0]]
+    assert len(_inserted_rows(mock_db)) == 2
+
+
+def test_embed_documents_skips_only_nan_embedding(mock_db):
+    model_instance = _model_instance()
+    model_instance.invoke_text_embedding.return_value = _embedding_result([1.0, 0.0], [0.0, 0.0], [0.0, 3.0])
+
+    result = CacheEmbedding(model_instance).embed_documents(["a", "zero", "c"])
+
+    # the zero vector normalizes to nan, later embeddings keep their positions
+    assert result == [[1.0, 0.0], None, [0.0, 1.0]]
+    rows = _inserted_rows(mock_db)
+    assert [row["hash"] for row in rows] == [generate_text_hash("a"), generate_text_hash("c")]
+    assert not any(math.isnan(value) for row in rows for value in Embedding(embedding=row["embedding"]).get_embedding())
+
+
+def test_embed_documents_batches_by_max_chunks(mock_db):
+    model_instance = _model_instance(max_chunks=2)
+    model_instance.invoke_text_embedding.side_effect = [
+        _embedding_result([1.0, 0.0], [0.0, 1.0]),
+        _embedding_result([2.0, 0.0]),
+    ]
+
+    result = CacheEmbedding(model_instance).embed_documents(["a", "b", "c"])
+
+    assert [call.kwargs["texts"] for call in model_instance.invoke_text_embedding.call_args_list] == [["a", "b"], ["c"]]
+    assert result == [[1.0, 0.0], [0.0, 1.0], [1.0, 0.0]]
+    # all new embeddings are cached with a single bulk insert
+    assert len(_inserted_rows(mock_db)) == 3
+
+
+def test_embed_documents_all_cached(mock_db):
+    mock_db.session.query.return_value.filter.return_value = [_cached("a", [1.0, 0.0])]
+    model_instance = _model_instance()
+
+    result = CacheEmbedding(model_instance).embed_documents(["a", "a"])
+
+    assert result == [[1.0, 0.0], [1.0, 0.0]]
+    model_instance.invoke_text_embedding.assert_not_called()
+    mock_db.session.execute.assert_not_called()
@@ -1,3 +1,4 @@
+import os
 import struct
 import time
 import uuid
@@ -7,7 +8,14 @@ import pytest
 from hypothesis import given
 from hypothesis import strategies as st
 
-from libs.uuid_utils import _create_uuidv7_bytes, uuidv7, uuidv7_boundary, uuidv7_timestamp
+from libs.uuid_utils import (
+    _UUID4_BATCH_SIZE,
+    _create_uuidv7_bytes,
+    uuid4_str,
+    uuidv7,
+    uuidv7_boundary,
+    uuidv7_timestamp,
+)
 
 
 # Tests for private helper function _create_uuidv7_bytes
@@ -349,3 +357,33 @@ def test_uuidv7_boundary_edge_cases():
     assert isinstance(current_uuid, uuid.UUID)
     assert current_uuid.version == 7
     assert uuidv7_timestamp(current_uuid) == current_time
+
+
+# Tests for uuid4_str
+def test_uuid4_str_is_canonical_uuidv4():
+    """Test generated strings round-trip as version 4 UUIDs."""
+    for _ in range(_UUID4_BATCH_SIZE * 2 + 1):  # cross batch boundaries
+        value = uuid4_str()
+
+        parsed = uuid.UUID(value)
+        assert parsed.version == 4
+        assert parsed.variant == uuid.RFC_4122
+        assert str(parsed) == value
+
+
+def test_uuid4_str_uniqueness():
+    """Test generated strings are unique."""
+    values = {uuid4_str() for _ in range(_UUID4_BATCH_SIZE * 4)}
+
+    assert len(values) == _UUID4_BATCH_SIZE * 4
+
+
+def test_uuid4_str_refills_pool_after_fork(monkeypatch):
+    """Test a forked process does not reuse the parent's random bytes."""
+    uuid4_str()
+
+    with mock.patch("libs.uuid_utils.os.urandom", wraps=os.urandom) as mock_urandom:
+        monkeypatch.setattr("libs.uuid_utils.os.getpid", lambda: -1)
+        uuid4_str()
+
+    mock_urandom.assert_called_once_with(16 * _UUID4_BATCH_SIZE)
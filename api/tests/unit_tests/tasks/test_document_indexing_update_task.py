@@ -0,0 +1,163 @@
+from unittest.mock import MagicMock, call, patch
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from core.indexing_runner import DocumentIsPausedError
+from tasks.document_indexing_update_task import CLEAN_BATCH_SIZE, document_indexing_update_task
+
+DATASET_ID = "dataset-id"
+DOCUMENT_ID = "document-id"
+
+
+def _result(first):
+    result = MagicMock()
+    result.first.return_value = first
+    return result
+
+
+@pytest.fixture
+def mock_db():
+    with patch("tasks.document_indexing_update_task.db") as mock_db:
+        mock_db.session.scalars.return_value.all.return_value = []
+        yield mock_db
+
+
+@pytest.fixture
+def mock_indexing_runner():
+    with patch("tasks.document_indexing_update_task.IndexingRunner") as mock_indexing_runner:
+        yield mock_indexing_runner
+
+
+@pytest.fixture
+def mock_extract_document():
+    with (
+        patch("tasks.document_indexing_update_task.current_app", new=MagicMock()),
+        patch("tasks.document_indexing_update_task._extract_document") as mock_extract_document,
+    ):
+        yield mock_extract_document
+
+
+@pytest.fixture
+def claimed(mock_db):
+    """Let the claim return a document and its dataset."""
+    document = MagicMock(id=DOCUMENT_ID, doc_form="text_model")
+    dataset = MagicMock(id=DATASET_ID)
+    mock_db.session.execute.return_value = _result((document, dataset))
+    return document, dataset
+
+
+class TestDocumentIndexingUpdateTaskClaim:
+    def test_document_not_found(self, mock_db, mock_indexing_runner):
+        mock_db.session.execute.side_effect = [_result(None), _result(None)]
+
+        with patch("tasks.document_indexing_update_task.logger") as mock_logger:
+            document_indexing_update_task.run(DATASET_ID, DOCUMENT_ID)
+
+        mock_logger.info.assert_called_with("Document not found: %s", DOCUMENT_ID)
+        mock_indexing_runner.assert_not_called()
+
+    def test_document_already_claimed(self, mock_db, mock_indexing_runner):
+        mock_db.session.execute.side_effect = [_result(None), _result((DOCUMENT_ID, DATASET_ID))]
+
+        with patch("tasks.document_indexing_update_task.logger") as mock_logger:
+            document_indexing_update_task.run(DATASET_ID, DOCUMENT_ID)
+
+        mock_logger.info.assert_called_with("Document is already being updated: %s", DOCUMENT_ID)
+        mock_indexing_runner.assert_not_called()
+
+    def test_dataset_not_found_records_error(self, mock_db, mock_indexing_runner):
+        mock_db.session.execute.side_effect = [_result(None), _result((DOCUMENT_ID, None)), MagicMock()]
+
+        with patch("tasks.document_indexing_update_task.logger") as mock_logger:
+            document_indexing_update_task.run(DATASET_ID, DOCUMENT_ID)
+
+        mock_logger.info.assert_called_with("Dataset not found: %s", DATASET_ID)
+        assert mock_db.session.execute.call_count == 3
+        mock_db.session.commit.assert_called()
+        mock_indexing_runner.assert_not_called()
+
+    def test_operational_error_retries_task(self, mock_db, mock_indexing_runner):
+        error = OperationalError("UPDATE documents", {}, Exception("connection lost"))
+        mock_db.session.execute.side_effect = error
+
+        with patch.object(document_indexing_update_task, "retry", return_value=RuntimeError("retry")) as mock_retry:
+            with pytest.raises(RuntimeError, match="retry"):
+                document_indexing_update_task.run(DATASET_ID, DOCUMENT_ID)
+
+        mock_retry.assert_called_once_with(exc=error, countdown=60)
+        mock_db.session.rollback.assert_called_once()
+        mock_indexing_runner.assert_not_called()
+
+
+class TestDocumentIndexingUpdateTaskExtraction:
+    def test_uses_extracted_text_docs(self, claimed, mock_indexing_runner, mock_extract_document):
+        document, _ = claimed
+        text_docs = [MagicMock()]
+        mock_extract_document.return_value = text_docs
+
+        document_indexing_update_task.run(DATASET_ID, DOCUMENT_ID)
+
+        mock_indexing_runner.return_value.run.assert_called_once_with([document], {DOCUMENT_ID: text_docs})
+
+    def test_extraction_failure_falls_back_to_runner(self, claimed, mock_indexing_runner, mock_extract_document):
+        document, _ = claimed
+        mock_extract_document.side_effect = ValueError("no upload file found")
+
+        document_indexing_update_task.run(DATASET_ID, DOCUMENT_ID)
+
+        # the runner extracts the document again and records a failure on it
+        mock_indexing_runner.return_value.run.assert_called_once_with([document], None)
+
+    def test_paused_during_extraction(self, claimed, mock_indexing_runner, mock_extract_document):
+        mock_extract_document.side_effect = DocumentIsPausedError()
+
+        document_indexing_update_task.run(DATASET_ID, DOCUMENT_ID)
+
+        mock_indexing_runner.return_value.run.assert_not_called()
+
+
+class TestDocumentIndexingUpdateTaskCleanup:
+    def test_cleans_small_document_inline(self, claimed, mock_db, mock_indexing_runner, mock_extract_document):
+        _, dataset = claimed
+        index_node_ids = [f"node-{i}" for i in range(10)]
+        mock_db.session.scalars.return_value.all.return_value = index_node_ids
+
+        with (
+            patch("tasks.document_indexing_update_task._get_index_processor") as mock_get_index_processor,
+            patch("tasks.document_indexing_update_task._clean_index_nodes") as mock_clean_index_nodes,
+        ):
+            document_indexing_update_task.run(DATASET_ID, DOCUMENT_ID)
+
+        mock_get_index_processor.return_value.clean.assert_called_once_with(
+            dataset, index_node_ids, with_keywords=True, delete_child_chunks=True
+        )
+        mock_clean_index_nodes.assert_not_called()
+        mock_db.session.query.return_value.where.return_value.delete.assert_called_once_with(synchronize_session=False)
+
+    def test_cleans_large_document_in_batches(self, claimed, mock_db, mock_indexing_runner, mock_extract_document):
+        index_node_ids = [f"node-{i}" for i in range(CLEAN_BATCH_SIZE * 2 + 1)]
+        mock_db.session.scalars.return_value.all.return_value = index_node_ids
+
+        with (
+            patch("tasks.document_indexing_update_task._get_index_processor") as mock_get_index_processor,
+            patch("tasks.document_indexing_update_task._clean_index_nodes") as mock_clean_index_nodes,
+        ):
+            document_indexing_update_task.run(DATASET_ID, DOCUMENT_ID)
+
+        mock_get_index_processor.return_value.clean.assert_not_called()
+        assert mock_clean_index_nodes.call_count == 3
+        mock_clean_index_nodes.assert_has_calls(
+            [
+                call(
+                    flask_app=mock_extract_document.call_args.kwargs["flask_app"],
+                    dataset_id=DATASET_ID,
+                    index_type="text_model",
+                    index_node_ids=index_node_ids[i : i + CLEAN_BATCH_SIZE],
+                )
+                for i in range(0, len(index_node_ids), CLEAN_BATCH_SIZE)
+            ],
+            any_order=True,
+        )
+        mock_db.session.query.return_value.where.return_value.delete.assert_called_once_with(synchronize_session=False)
+        mock_indexing_runner.return_value.run.assert_called_once()